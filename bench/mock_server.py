@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Mock OpenAI-compatible /v1/chat/completions server for benchmarks.
+
+Every reply is "EN(<source text>)" (kana and kanji swapped for latin
+letters, so replies pass validation) and runs don't need a GPU. Latency, output
+token rate, failures and runaway "###" suffixes can be dialled in to see how
+the pipeline copes, and batched requests get a JSON array back.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from honsetrans.tokens import approx_tokens
+from honsetrans.validation import JAPANESE
+
+JUNK_SUFFIX = "\n### Response:\n### Instruction:\nTranslate the following text into English."
+
+
+class MockStats:
+    """Counters for everything the mock server has seen."""
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.request_bytes = 0
+        self.prompt_bytes = 0
+        self.response_bytes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self):
+        with self._lock:
+            return {name: value for name, value in vars(self).items() if not name.startswith("_")}
+
+
+def romanize(text):
+    """Stand-in for translating: every kana/kanji becomes some latin letter."""
+    return JAPANESE.sub(lambda match: chr(ord("a") + ord(match.group(0)) % 26), text)
+
+
+def mock_translation(content):
+    """What the mock model answers for a user message."""
+    if content.startswith('[{"id"'):
+        try:
+            items = json.loads(content)
+        except ValueError:
+            items = None
+        if isinstance(items, list):
+            return json.dumps([{"id": item["id"], "text": f"EN({romanize(item['text'])})"} for item in items],
+                              ensure_ascii=False)
+    return f"EN({romanize(content)})"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.stats.add(response_bytes=len(data))
+
+    def do_GET(self):
+        self._send_json(200, self.server.stats.as_dict())
+
+    def do_POST(self):
+        settings = self.server.settings
+        stats = self.server.stats
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.loads(raw)
+        messages = body.get("messages", [])
+        prompt = "".join(message.get("content", "") for message in messages)
+        prompt_tokens = approx_tokens(prompt)
+        stats.add(requests=1, request_bytes=len(raw), prompt_bytes=len(prompt.encode("utf-8")),
+                  prompt_tokens=prompt_tokens)
+
+        time.sleep(settings["latency"])
+        if random.random() < settings["failure_rate"]:
+            stats.add(failures=1)
+            self._send_json(503, {"error": "mock server overloaded"})
+            return
+
+        content = mock_translation(messages[-1]["content"] if messages else "")
+        if random.random() < settings["junk_rate"]:
+            content += JUNK_SUFFIX * settings["junk_repeat"]
+        finish_reason = "stop"
+        max_tokens = body.get("max_tokens")
+        if max_tokens and approx_tokens(content) > max_tokens:
+            # Cut to roughly max_tokens, like a real server would
+            while content and approx_tokens(content) > max_tokens:
+                content = content[:int(len(content) * 0.9)]
+            finish_reason = "length"
+        completion_tokens = approx_tokens(content)
+        stats.add(completion_tokens=completion_tokens)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+
+        if body.get("stream"):
+            self._stream(content, finish_reason, usage)
+            return
+        if settings["token_rate"]:
+            time.sleep(completion_tokens / settings["token_rate"])
+        self._send_json(200, {
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": finish_reason}],
+            "usage": usage,
+        })
+
+    def _stream(self, content, finish_reason, usage):
+        token_rate = self.server.settings["token_rate"]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(chunk):
+            data = b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n"
+            self.wfile.write(data)
+            self.wfile.flush()
+            self.server.stats.add(response_bytes=len(data))
+
+        # Roughly one token per chunk
+        pieces = [content[index:index + 2] for index in range(0, len(content), 2)]
+        try:
+            for piece in pieces:
+                if token_rate:
+                    time.sleep(approx_tokens(piece) / token_rate)
+                event({"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+            event({"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}], "usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up early after spotting a ### marker
+            pass
+
+
+class MockServer:
+    """A MockHandler server running on a background thread; port 0 picks a free port."""
+
+    def __init__(self, port=0, latency=0.05, token_rate=0.0, failure_rate=0.0, junk_rate=0.0, junk_repeat=20):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.settings = {
+            "latency": latency,
+            "token_rate": token_rate,
+            "failure_rate": failure_rate,
+            "junk_rate": junk_rate,
+            "junk_repeat": junk_repeat,
+        }
+        self.httpd.stats = MockStats()
+        self._thread = None
+
+    @property
+    def settings(self):
+        return dict(self.httpd.settings)
+
+    @property
+    def stats(self):
+        return self.httpd.stats
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before every reply (default 0.05)")
+    parser.add_argument("--token-rate", type=float, default=0.0,
+                        help="output tokens per second per request, 0 for instant (default 0)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with HTTP 503")
+    parser.add_argument("--junk-rate", type=float, default=0.0,
+                        help="share of replies that run on with a '### Response:' suffix")
+    parser.add_argument("--junk-repeat", type=int, default=20, help="how many times the junk suffix repeats")
+
+
+def server_from_args(args, port=0):
+    return MockServer(port, args.latency, args.token_rate, args.failure_rate, args.junk_rate, args.junk_repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completions server")
+    parser.add_argument("--port", type=int, default=1234, help="port to listen on (default 1234)")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args, args.port)
+    print(f"Mock server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats.as_dict(), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for main.py and translate_character_system.py.
+
+Starts the mock server from mock_server.py, builds a synthetic corpus from
+raw/example.json and character_system_text_example.json in a scratch
+folder, runs process_json over every story file and
+process_character_system_text over the character file, and reports
+segments/s, requests/s, prompt bytes and wall time. Results are saved as
+JSON under bench/results, together with the scripts' own run reports, so
+runs can be compared.
+"""
+import argparse
+import contextlib
+import copy
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import toml
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+from bench.mock_server import add_server_arguments, server_from_args
+from honsetrans.segments import count_pending
+
+
+def vary(text, tag):
+    """Make text unique to one synthetic copy so the translation memory doesn't hide the work."""
+    # Spelled in kana rather than digits, which template masking would see through
+    tag = "".join("アイウエオカキクケコ"[int(digit)] for digit in str(tag))
+    return f"{text}（{tag}）" if text else text
+
+
+def make_story_corpus(folder, files):
+    """Write files copies of raw/example.json with unique text; returns their paths."""
+    with open(REPO_ROOT / "raw" / "example.json", "r", encoding="utf-8") as f:
+        template = json.load(f)
+    story_folder = folder / "raw" / "story"
+    story_folder.mkdir(parents=True)
+    paths = []
+    for index in range(files):
+        data = copy.deepcopy(template)
+        data["storyId"] = f"{index:09d}"
+        data["title"] = vary(data.get("title"), index)
+        # Names are left alone: the same speakers come up in every real story
+        for block in data.get("text", []):
+            block["jpText"] = vary(block.get("jpText"), index)
+            for choice in block.get("choices", []):
+                choice["jpText"] = vary(choice.get("jpText"), index)
+        path = story_folder / f"{index:05d}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        paths.append(str(path.relative_to(folder)))
+    return paths
+
+
+def make_character_corpus(folder, characters):
+    """Write character_system_text.json with characters copies of the example's characters."""
+    with open(REPO_ROOT / "character_system_text_example.json", "r", encoding="utf-8") as f:
+        template = json.load(f)
+    data = {}
+    for index in range(characters):
+        for char_id, texts in template.items():
+            data[f"{char_id}{index:03d}"] = {
+                text_id: vary(text, index) for text_id, text in texts.items()
+            }
+    with open(folder / "character_system_text.json", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    return sum(1 for texts in data.values() for text in texts.values() if text and text.strip())
+
+
+def parse_override(setting):
+    """Turn section.key=value (value in TOML syntax) into (section, key, value)."""
+    name, _, value = setting.partition("=")
+    section, _, key = name.strip().partition(".")
+    if not key:
+        raise argparse.ArgumentTypeError(f"expected section.key=value, got {setting!r}")
+    try:
+        parsed = toml.loads(f"value = {value.strip()}")["value"]
+    except toml.TomlDecodeError:
+        parsed = value.strip()
+    return section, key, parsed
+
+
+def write_config(folder, api_url, overrides):
+    config = toml.load(REPO_ROOT / "config.toml")
+    config["server"]["api_url"] = api_url
+    config.pop("backends", None)
+    for section, key, value in overrides:
+        config.setdefault(section, {})[key] = value
+    with open(folder / "config.toml", "w", encoding="utf-8") as f:
+        toml.dump(config, f)
+    return config
+
+
+def measure(server, segments, run):
+    """Run one scenario and return its numbers, counted from the mock server's side."""
+    before = server.stats.as_dict()
+    start = time.perf_counter()
+    run()
+    wall = time.perf_counter() - start
+    after = server.stats.as_dict()
+    delta = {key: after[key] - before[key] for key in after}
+    result = {
+        "segments": segments,
+        "wall_seconds": round(wall, 3),
+        "segments_per_second": round(segments / wall, 2) if wall else None,
+        "requests_per_second": round(delta["requests"] / wall, 2) if wall else None,
+    }
+    result.update(delta)
+    return result
+
+
+def describe(name, result):
+    return (f"{name}: {result['segments']} segments in {result['wall_seconds']:.2f}s, "
+            f"{result['segments_per_second']} segments/s, {result['requests']} requests "
+            f"({result['requests_per_second']} /s), {result['prompt_bytes'] / 1024:.0f} KiB of prompts")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the translation scripts against a mock server")
+    parser.add_argument("--files", type=int, default=10, help="synthetic story files to generate (default 10)")
+    parser.add_argument("--characters", type=int, default=5,
+                        help="copies of the example characters to generate (default 5)")
+    parser.add_argument("--only", choices=["story", "character"], help="run just one of the two scenarios")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], type=parse_override,
+                        metavar="SECTION.KEY=VALUE",
+                        help="override a config.toml setting, e.g. --set server.max_concurrency=8 (repeatable)")
+    parser.add_argument("--output", help="where to save the JSON results (default bench/results/<time>.json)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch folder instead of deleting it")
+    parser.add_argument("--verbose", action="store_true", help="show the scripts' own output")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args).start()
+    folder = Path(tempfile.mkdtemp(prefix="honsetrans-bench-"))
+    cwd = os.getcwd()
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "mock_server": server.settings,
+        "overrides": {f"{section}.{key}": value for section, key, value in args.overrides},
+        "scenarios": {},
+    }
+    try:
+        shutil.copy(REPO_ROOT / "dictionary.json", folder / "dictionary.json")
+        write_config(folder, server.url, args.overrides)
+        story_paths = make_story_corpus(folder, args.files) if args.only != "character" else []
+        char_segments = make_character_corpus(folder, args.characters) if args.only != "story" else 0
+        print(f"Scratch folder: {folder}")
+
+        os.chdir(folder)
+        # The scripts read config.toml and dictionary.json from the working folder when imported
+        with open(os.devnull, "w") as devnull, \
+                (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)):
+            if story_paths:
+                story_segments = 0
+                for path in story_paths:
+                    with open(path, "r", encoding="utf-8") as f:
+                        story_segments += count_pending(json.load(f))
+                main_module = importlib.import_module("main")
+                results["scenarios"]["story"] = measure(
+                    server, story_segments,
+                    lambda: [main_module.process_json(path) for path in story_paths])
+                results["scenarios"]["story"]["metrics"] = main_module.translator.metrics.report()
+            if char_segments:
+                character_module = importlib.import_module("translate_character_system")
+                results["scenarios"]["character_system"] = measure(
+                    server, char_segments,
+                    character_module.process_character_system_text)
+                results["scenarios"]["character_system"]["metrics"] = character_module.translator.metrics.report()
+    finally:
+        os.chdir(cwd)
+        server.stop()
+        if args.keep:
+            print(f"Kept scratch folder {folder}")
+        else:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    for name, result in results["scenarios"].items():
+        print(describe(name, result))
+    output = Path(args.output) if args.output else (
+        REPO_ROOT / "bench" / "results" / f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Spread requests over several OpenAI-compatible servers.
+"""
+import threading
+import time
+
+from honsetrans.client import ApiClient, ApiClientError, ApiError
+
+
+class Backend:
+    """One server, its client and the counters used to route and report on it."""
+
+    def __init__(self, backend_config, metrics=None):
+        self.api_url = backend_config["api_url"]
+        self.model = backend_config["model"]
+        self.weight = max(backend_config.get("weight", backend_config.get("max_concurrency", 1)), 1)
+        self.client = ApiClient(dict(backend_config, max_concurrency=self.weight), metrics)
+        self.outstanding = 0
+        self.failures = 0
+        self.unhealthy = False
+        self.unhealthy_until = 0.0
+        self.probing = False
+        self.completed = 0
+        self.failed = 0
+        self.first_used = None
+        self.last_done = None
+
+    def load(self):
+        return self.outstanding / self.weight
+
+    def summary(self):
+        elapsed = (self.last_done - self.first_used) if self.first_used and self.last_done else 0
+        rate = f"{self.completed / elapsed:.2f} req/s" if elapsed > 0 else "n/a"
+        return f"Backend {self.api_url} ({self.model}): {self.completed} done, {self.failed} failed, {rate}"
+
+
+class Dispatcher:
+    """
+    Routes each request to the healthy backend with the fewest outstanding
+    requests per unit of weight.
+
+    A backend that fails unhealthy_after requests in a row is left alone for
+    reprobe_after seconds. After that it gets a single probe request, sent
+    without retries if another backend can take it over; the other threads
+    keep away until the probe succeeds. While no other backend is healthy
+    there's nothing to wait for, so the probe goes out right away instead
+    and requests go to it one at a time until it recovers.
+    """
+
+    def __init__(self, server_config, backend_configs=None, metrics=None):
+        if backend_configs:
+            # Anything a backend doesn't set (timeouts, retries, ...) comes from [server]
+            self.backends = [Backend(dict(server_config, **backend), metrics) for backend in backend_configs]
+        else:
+            self.backends = [Backend(dict(server_config, weight=server_config.get("max_concurrency", 1)), metrics)]
+        self.unhealthy_after = server_config.get("unhealthy_after", 3)
+        self.reprobe_after = server_config.get("reprobe_after", 30)
+        self._condition = threading.Condition()
+
+    @property
+    def capacity(self):
+        """How many requests the backends can take at once in total."""
+        return sum(backend.weight for backend in self.backends)
+
+    def _acquire(self, exclude):
+        """(backend, whether the request is its probe), or (None, False) once every backend is excluded."""
+        with self._condition:
+            while True:
+                now = time.time()
+                available = [backend for backend in self.backends if backend not in exclude]
+                healthy = [backend for backend in available if not backend.unhealthy]
+                # Unhealthy backends due a probe; with no healthy one to use they needn't wait
+                due = [backend for backend in available if backend.unhealthy and not backend.probing
+                       and (backend.unhealthy_until <= now or not healthy)]
+                if due or healthy:
+                    probe = bool(due)
+                    backend = due[0] if probe else min(healthy, key=Backend.load)
+                    backend.outstanding += 1
+                    backend.probing = probe
+                    if backend.first_used is None:
+                        backend.first_used = now
+                    return backend, probe
+                if not available:
+                    return None, False
+                self._condition.wait(max(min(b.unhealthy_until for b in available) - now, 0.1))
+
+    def _release(self, backend, ok, probe):
+        """ok is None for a request the server turned down, which leaves the backend's health alone."""
+        with self._condition:
+            backend.outstanding -= 1
+            backend.last_done = time.time()
+            if probe:
+                backend.probing = False
+            if ok:
+                backend.completed += 1
+                backend.failures = 0
+                if backend.unhealthy:
+                    print(f"Backend {backend.api_url} recovered")
+                    backend.unhealthy = False
+            elif ok is False:
+                backend.failed += 1
+                backend.failures += 1
+                if backend.unhealthy:
+                    backend.unhealthy_until = time.time() + self.reprobe_after
+                elif backend.failures >= self.unhealthy_after:
+                    print(f"Backend {backend.api_url} marked unhealthy, retrying it in {self.reprobe_after}s")
+                    backend.unhealthy = True
+                    backend.unhealthy_until = time.time() + self.reprobe_after
+            self._condition.notify_all()
+
+    def chat(self, post_request, max_chars=None):
+        """
+        Send post_request to the best backend, failing over to the others on
+        ApiError. An ApiClientError is about the request, not the backend, so
+        it is raised straight away and doesn't count against the backend's health.
+        """
+        tried = []
+        last_error = None
+        while True:
+            backend, probe = self._acquire(tried)
+            if backend is None:
+                raise last_error
+            tried.append(backend)
+            # A probe that can fail over gets one attempt, not the whole retry budget
+            fallback = probe and any(b not in tried for b in self.backends)
+            try:
+                body = backend.client.chat(dict(post_request, model=backend.model), max_chars,
+                                           0 if fallback else None)
+            except ApiClientError:
+                self._release(backend, None, probe)
+                raise
+            except ApiError as error:
+                self._release(backend, False, probe)
+                last_error = error
+                continue
+            self._release(backend, True, probe)
+            return body
+
+    def summary(self):
+        """Request and per-backend throughput lines for the end of a run."""
+        lines = [backend.client.summary() for backend in self.backends]
+        if len(self.backends) > 1:
+            lines = [f"{backend.summary()}\n  {line}" for backend, line in zip(self.backends, lines)]
+        return lines
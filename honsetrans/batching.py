@@ -0,0 +1,73 @@
+"""
+Pack several short segments into one request and unpack the reply.
+"""
+import json
+
+BATCH_INSTRUCTIONS = (
+    " The text is a JSON array of objects with an \"id\" and a \"text\"."
+    " Translate every \"text\" and reply with only a JSON array of objects"
+    " with the same \"id\" and the translated \"text\"."
+)
+
+
+def make_batches(jobs, max_segments, max_chars):
+    """
+    Split jobs into consecutive groups of at most max_segments jobs whose
+    source text adds up to at most max_chars characters.
+
+    A job longer than max_chars on its own still gets a group to itself.
+    """
+    batches = []
+    current = []
+    current_chars = 0
+    for job in jobs:
+        size = len(job.source)
+        if current and (len(current) >= max_segments or current_chars + size > max_chars):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append(job)
+        current_chars += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_payload(texts):
+    """Serialise texts as the ID-tagged JSON array sent as the user message."""
+    return json.dumps(
+        [{"id": index, "text": text} for index, text in enumerate(texts, 1)],
+        ensure_ascii=False,
+    )
+
+
+def parse_batch_response(content, count):
+    """
+    Read the model's JSON array back into a list of count translations.
+
+    Anything that can't be matched to an id (malformed JSON, missing or
+    unknown ids, non-string text) is left as None so only those segments
+    need to be sent again on their own.
+    """
+    results = [None] * count
+    start = content.find("[")
+    end = content.rfind("]")
+    if start == -1 or end < start:
+        return results
+    try:
+        items = json.loads(content[start:end + 1])
+    except ValueError:
+        return results
+    if not isinstance(items, list):
+        return results
+
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("id")
+        text = item.get("text")
+        if isinstance(index, str) and index.isdigit():
+            index = int(index)
+        if isinstance(index, int) and 1 <= index <= count and isinstance(text, str):
+            results[index - 1] = text
+    return results
@@ -0,0 +1,117 @@
+"""
+On-disk translation memory so repeated source text never reaches the server twice.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class TranslationMemory:
+    """
+    SQLite-backed cache of finished translations.
+
+    Entries are keyed on a hash of the source text together with everything
+    else that changes the model's answer (model, system prompt, sampling
+    params and dictionary). Once more than max_entries are stored the least
+    recently used ones are evicted.
+    """
+
+    def __init__(self, path, context, max_entries=200000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.context_hash = hashlib.sha256(
+            json.dumps(context, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memory ("
+            "key TEXT PRIMARY KEY, source TEXT, translation TEXT, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS memory_last_used ON memory(last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+
+    def key(self, text):
+        """Return the cache key for text under the current context."""
+        return hashlib.sha256(f"{self.context_hash}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text, count=True):
+        """
+        Return the stored translation for text, or None on a miss. With
+        count=False the caller reports the outcome itself through
+        record_lookup, e.g. after trying more than one key for a segment.
+        """
+        key = self.key(text)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT translation FROM memory WHERE key = ?", (key,)
+            ).fetchone()
+            if count:
+                self._count(row is not None)
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE memory SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def record_lookup(self, hit):
+        """Count one lookup made with get(..., count=False)."""
+        with self._lock:
+            self._count(hit)
+
+    def put(self, text, translation):
+        """Store a translation, evicting the least recently used entries over the cap."""
+        key = self.key(text)
+        with self._lock:
+            exists = self._conn.execute(
+                "SELECT 1 FROM memory WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO memory (key, source, translation, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, text, translation, time.time()),
+            )
+            if exists is None:
+                self._size += 1
+            if self.max_entries and self._size > self.max_entries:
+                excess = self._size - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM memory WHERE key IN "
+                    "(SELECT key FROM memory ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                self._size -= excess
+            self._conn.commit()
+
+    def delete(self, text):
+        """Drop the stored translation for text, if there is one."""
+        key = self.key(text)
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM memory WHERE key = ?", (key,)).rowcount
+            self._size -= deleted
+            self._conn.commit()
+
+    def summary(self):
+        """One-line hit/miss report for the end of a run."""
+        lookups = self.hits + self.misses
+        rate = (self.hits / lookups * 100) if lookups else 0.0
+        return (f"Translation memory: {self.hits} hits, {self.misses} misses "
+                f"({rate:.1f}% hit rate), {self._size} entries stored")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
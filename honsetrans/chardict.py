@@ -0,0 +1,201 @@
+"""
+Streaming access to character_system_text.json and an append-only store for
+new character_system_text_dict.json entries.
+
+The dict file is never loaded whole: the (char_id, text_id) pairs it already
+has are indexed once into a SQLite sidecar, new translations are appended to
+the same sidecar as they finish, and compact() streams the old dict and the
+additions into a fresh dict file one character at a time.
+"""
+import json
+import os
+import sqlite3
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def _require_ijson():
+    if ijson is None:
+        raise ImportError("Streaming the character system text needs ijson (pip install ijson)")
+
+
+def iter_char_texts(path):
+    """Yield (char_id, {text_id: text}) from a character system JSON file, one character at a time."""
+    _require_ijson()
+    with open(path, "rb") as file:
+        yield from ijson.kvitems(file, "", use_float=True)
+
+
+def _dumps(value):
+    # Same layout as json.dump(indent=4, ensure_ascii=False) two levels down
+    return json.dumps(value, indent=4, ensure_ascii=False).replace("\n", "\n        ")
+
+
+def _write_char(file, char_id, texts, first):
+    file.write(f'{"" if first else ","}\n    {_dumps(char_id)}: ')
+    if not texts:
+        file.write("{}")
+        return
+    file.write("{")
+    for index, (text_id, text) in enumerate(texts.items()):
+        file.write(f'{"," if index else ""}\n        {_dumps(text_id)}: {_dumps(text)}')
+    file.write("\n    }")
+
+
+class CharDictStore:
+    """
+    SQLite sidecar for one character_system_text_dict.json.
+
+    `existing` mirrors the keys of the dict file (rebuilt whenever the file's
+    size or modified time changes) and `additions` is the append-only log of
+    translations not yet compacted into it.
+    """
+
+    def __init__(self, dict_path, sidecar_path):
+        self.dict_path = dict_path
+        self.sidecar_path = sidecar_path
+        self._conn = sqlite3.connect(sidecar_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS existing ("
+            "char_id TEXT, text_id TEXT, PRIMARY KEY (char_id, text_id)) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS additions (char_id TEXT, text_id TEXT, text TEXT, position INTEGER)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(additions)")}
+        if "position" not in columns:
+            # Sidecars from before additions kept their source position
+            self._conn.execute("ALTER TABLE additions ADD COLUMN position INTEGER")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS additions_char ON additions(char_id)")
+        self._conn.commit()
+        self._sync_index()
+
+    def _dict_stat(self):
+        if not os.path.exists(self.dict_path):
+            return ""
+        stat = os.stat(self.dict_path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _sync_index(self):
+        """Re-index the dict file's keys if it changed since the sidecar last saw it."""
+        stat = self._dict_stat()
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dict_stat'").fetchone()
+        if row is not None and row[0] == stat:
+            return
+        self._conn.execute("DELETE FROM existing")
+        if stat:
+            print(f"Indexing {self.dict_path}")
+            for char_id, texts in iter_char_texts(self.dict_path):
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO existing (char_id, text_id) VALUES (?, ?)",
+                    ((char_id, text_id) for text_id in texts),
+                )
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dict_stat', ?)", (stat,))
+        self._conn.commit()
+
+    def translated_ids(self, char_id):
+        """Return the set of text_ids of char_id that are in the dict or already added."""
+        rows = self._conn.execute(
+            "SELECT text_id FROM existing WHERE char_id = ? "
+            "UNION SELECT text_id FROM additions WHERE char_id = ?",
+            (char_id, char_id),
+        )
+        return {row[0] for row in rows}
+
+    def add(self, char_id, text_id, text, position=None):
+        """
+        Append one new translation; it is on disk once this returns.
+        position is the entry's place in the source file, which compact()
+        writes additions in, whatever order they finished in.
+        """
+        self._conn.execute(
+            "INSERT INTO additions (char_id, text_id, text, position) VALUES (?, ?, ?, ?)",
+            (char_id, text_id, text, position),
+        )
+        self._conn.commit()
+
+    def pending_count(self):
+        """Number of additions not yet compacted into the dict file."""
+        return self._conn.execute("SELECT COUNT(*) FROM additions").fetchone()[0]
+
+    def _additions_for(self, char_id):
+        rows = self._conn.execute(
+            "SELECT text_id, text FROM additions WHERE char_id = ? ORDER BY position, rowid", (char_id,)
+        )
+        return dict(rows)
+
+    def compact(self):
+        """
+        Merge the additions into the dict file and clear them.
+
+        Existing characters keep their place with new text_ids added at the
+        end in source order, new characters follow in source order.
+        The file is replaced atomically. Returns how many entries were merged.
+        """
+        count = self.pending_count()
+        if not count:
+            return 0
+        self._rewrite({})
+        return count
+
+    def remove(self, entries):
+        """
+        Drop (char_id, text_id) entries from the dict file and from the
+        additions, so they count as untranslated again. Pending additions
+        are merged in on the way. Returns how many translations were dropped.
+        """
+        removed = {}
+        for char_id, text_id in entries:
+            removed.setdefault(char_id, set()).add(text_id)
+        dropped = sum(len(text_ids & self.translated_ids(char_id)) for char_id, text_ids in removed.items())
+        if not dropped:
+            return 0
+        for char_id, text_ids in removed.items():
+            for text_id in text_ids:
+                self._conn.execute("DELETE FROM additions WHERE char_id = ? AND text_id = ?", (char_id, text_id))
+                self._conn.execute("DELETE FROM existing WHERE char_id = ? AND text_id = ?", (char_id, text_id))
+        self._rewrite(removed)
+        return dropped
+
+    def _rewrite(self, removed):
+        """Stream the dict file and the additions, minus removed ({char_id: text_ids}), into a new dict file."""
+        def kept(char_id, texts):
+            drop = removed.get(char_id)
+            return {text_id: text for text_id, text in texts.items() if text_id not in drop} if drop else texts
+
+        tmp_path = f"{self.dict_path}.tmp"
+        first = True
+        written = set()
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write("{")
+            if os.path.exists(self.dict_path):
+                for char_id, texts in iter_char_texts(self.dict_path):
+                    texts.update(self._additions_for(char_id))
+                    _write_char(file, char_id, kept(char_id, texts), first)
+                    written.add(char_id)
+                    first = False
+            new_chars = self._conn.execute(
+                "SELECT char_id FROM additions GROUP BY char_id ORDER BY MIN(position), MIN(rowid)"
+            ).fetchall()
+            for (char_id,) in new_chars:
+                if char_id in written:
+                    continue
+                _write_char(file, char_id, kept(char_id, self._additions_for(char_id)), first)
+                first = False
+            file.write("}" if first else "\n}")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.dict_path)
+
+        self._conn.execute("INSERT OR IGNORE INTO existing (char_id, text_id) SELECT char_id, text_id FROM additions")
+        self._conn.execute("DELETE FROM additions")
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dict_stat', ?)", (self._dict_stat(),))
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
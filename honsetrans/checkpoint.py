@@ -0,0 +1,131 @@
+"""
+Crash-safe progress for long translation runs.
+
+Every finished segment is appended to a JSONL journal next to the target file
+and the target itself is rewritten atomically every so often, so an
+interrupted run only loses the requests that were still in flight.
+"""
+import json
+import os
+import time
+
+from honsetrans import jsonio
+
+
+def atomic_write_json(path, data):
+    """Write data as JSON to a temporary file and rename it over path."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(jsonio.dumps(data))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """Journal of finished segments for one target JSON file."""
+
+    def __init__(self, target_path, data, checkpoint_config=None):
+        checkpoint_config = checkpoint_config or {}
+        self.target_path = target_path
+        self.data = data
+        self.enabled = checkpoint_config.get("enabled", True)
+        self.interval_segments = checkpoint_config.get("interval_segments", 25)
+        self.interval_seconds = checkpoint_config.get("interval_seconds", 60)
+        self.journal_path = f"{target_path}.journal.jsonl"
+        self._journal = None
+        self._since_write = 0
+        self._last_write = time.time()
+
+    def _journalled(self):
+        """{key: text} of every record in the journal."""
+        done = {}
+        if not self.enabled or not os.path.exists(self.journal_path):
+            return done
+        with open(self.journal_path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may have been cut off mid-write
+                    continue
+                done[record["key"]] = record["text"]
+        return done
+
+    def replay(self, jobs):
+        """
+        Fill every job that the journal already has a result for.
+
+        Returns the jobs that still need translating.
+        """
+        done = self._journalled()
+        if not done:
+            return jobs
+
+        remaining = []
+        for job in jobs:
+            if job.key in done:
+                job.target[job.field] = done[job.key]
+            else:
+                remaining.append(job)
+        if len(remaining) != len(jobs):
+            print(f"Resumed {len(jobs) - len(remaining)} segments from {self.journal_path}")
+        return remaining
+
+    def restore(self):
+        """Put every journalled result back into data under its key, for data keyed like the journal (dedup results)."""
+        done = self._journalled()
+        self.data.update(done)
+        if done:
+            print(f"Resumed {len(done)} results from {self.journal_path}")
+        return len(done)
+
+    def forget(self, match):
+        """Drop the journalled results whose key match(key) is true for; returns how many were dropped."""
+        if not self.enabled or not os.path.exists(self.journal_path):
+            return 0
+        kept = []
+        dropped = 0
+        with open(self.journal_path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if match(record["key"]):
+                    dropped += 1
+                else:
+                    kept.append(line if line.endswith("\n") else line + "\n")
+        if dropped:
+            tmp_path = f"{self.journal_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                file.writelines(kept)
+            os.replace(tmp_path, self.journal_path)
+        return dropped
+
+    def record(self, job):
+        """Journal a job whose result was just written into its slot."""
+        if not self.enabled:
+            return
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps({"key": job.key, "text": job.target[job.field]}, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+        self._since_write += 1
+        if (self._since_write >= self.interval_segments
+                or time.time() - self._last_write >= self.interval_seconds):
+            self.save()
+
+    def save(self):
+        """Atomically write the target file; the journal is no longer needed after that."""
+        atomic_write_json(self.target_path, self.data)
+        self._since_write = 0
+        self._last_write = time.time()
+        if self.enabled:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
@@ -0,0 +1,219 @@
+"""
+Shared HTTP client for the chat completions endpoint.
+
+One pooled requests.Session is reused for every call so connections stay
+alive between requests, and transient failures are retried with jittered
+exponential backoff instead of ending the run.
+"""
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+OVERLOAD_STATUS = {429, 503}
+
+
+class ApiError(Exception):
+    """The server could not produce a usable response, even after retrying."""
+
+
+class ApiClientError(ApiError):
+    """The server turned the request itself down (a 4xx that isn't worth retrying)."""
+
+
+def cut_at_marker(text, marker="###"):
+    """
+    Return text up to the first marker that follows some actual output, or
+    None if there is no such marker yet.
+    """
+    index = text.find(marker)
+    while index != -1:
+        if text[:index].strip():
+            return text[:index].rstrip()
+        index = text.find(marker, index + len(marker))
+    return None
+
+
+class ApiClient:
+    """Pooled, retrying client for one OpenAI-compatible chat completions URL."""
+
+    def __init__(self, server_config, metrics=None):
+        self.metrics = metrics
+        self.api_url = server_config["api_url"]
+        self.timeout = (server_config.get("connect_timeout", 10), server_config.get("read_timeout", 300))
+        self.max_retries = server_config.get("max_retries", 5)
+        self.backoff_base = server_config.get("backoff_base", 1.0)
+        self.backoff_max = server_config.get("backoff_max", 60.0)
+
+        pool_size = max(server_config.get("max_concurrency", 1), server_config.get("pool_size", 0), 1)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {server_config['api_key']}"
+        })
+
+        # Called when the server signals it's over capacity (set by the adaptive limiter)
+        self.on_overload = None
+        self.latencies = []
+        self.retries = 0
+        self.cutoffs = {"marker": 0, "runaway": 0}
+        self._lock = threading.Lock()
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    def _read_stream(self, response, max_chars=None, start=None):
+        """
+        Collect a server-sent event stream into a regular response body.
+
+        Reading stops as soon as a "###" marker shows up after the answer or
+        the output grows past max_chars, and the connection is dropped so the
+        server stops generating. Returns the body, the bytes read and the
+        time to the first token (None if no content arrived).
+        """
+        content = ""
+        finish_reason = None
+        usage = None
+        received = 0
+        ttft = None
+        try:
+            for line in response.iter_lines():
+                received += len(line) + 1
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                if not chunk.get("choices"):
+                    continue
+                choice = chunk["choices"][0]
+                finish_reason = choice.get("finish_reason") or finish_reason
+                piece = (choice.get("delta") or {}).get("content") or ""
+                if not piece:
+                    continue
+                if ttft is None and start is not None:
+                    ttft = time.perf_counter() - start
+                content += piece
+
+                # Only the new piece (plus two chars that may start a split marker) can hold a new "###"
+                if "###" in content[-(len(piece) + 2):]:
+                    cut = cut_at_marker(content)
+                    if cut is not None:
+                        content = cut
+                        finish_reason = "marker"
+                        break
+                if max_chars and len(content) > max_chars:
+                    content = content[:max_chars]
+                    finish_reason = "runaway"
+                    break
+        finally:
+            response.close()
+
+        if finish_reason in self.cutoffs:
+            with self._lock:
+                self.cutoffs[finish_reason] += 1
+        body = {
+            "choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+        return body, received, ttft
+
+    def chat(self, post_request, max_chars=None, max_retries=None):
+        """
+        POST post_request and return the decoded response body.
+
+        If post_request asks for stream, the reply is read incrementally and
+        cut off early (see _read_stream), with max_chars as the runaway limit.
+        Connection errors, timeouts, transient status codes and bodies
+        without choices[0].message.content are retried; anything else, or
+        running out of retries (max_retries, by default the configured
+        number), raises ApiError.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        stream = bool(post_request.get("stream"))
+        payload = json.dumps(post_request).encode("utf-8")
+        for attempt in range(max_retries + 1):
+            retry_after = None
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.api_url, data=payload, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                failure = error
+                if isinstance(error, requests.Timeout) and self.on_overload is not None:
+                    self.on_overload()
+            else:
+                if response.status_code in RETRY_STATUS:
+                    failure = f"HTTP {response.status_code}"
+                    retry_after = response.headers.get("Retry-After")
+                    # A streamed response holds its connection until closed
+                    response.close()
+                    if response.status_code in OVERLOAD_STATUS and self.on_overload is not None:
+                        self.on_overload()
+                elif response.status_code >= 400:
+                    if self.metrics is not None:
+                        self.metrics.record_failure()
+                    raise ApiClientError(f"Request to {self.api_url} failed: HTTP {response.status_code} {response.text[:200]}")
+                else:
+                    try:
+                        if stream:
+                            body, received, ttft = self._read_stream(response, max_chars, start)
+                        else:
+                            body, received, ttft = response.json(), len(response.content), None
+                        if not isinstance(body["choices"][0]["message"]["content"], str):
+                            raise TypeError("message content is not a string")
+                    except requests.RequestException as error:
+                        failure = f"connection lost while reading the response ({error})"
+                    except (ValueError, KeyError, IndexError, TypeError) as error:
+                        failure = f"malformed response body ({error!r})"
+                    else:
+                        latency = time.perf_counter() - start
+                        with self._lock:
+                            self.latencies.append(latency)
+                        if self.metrics is not None:
+                            self.metrics.record_request(latency, len(payload), received, body.get("usage"), ttft)
+                        return body
+
+            if attempt == max_retries:
+                if self.metrics is not None:
+                    self.metrics.record_failure()
+                raise ApiError(f"Request to {self.api_url} failed after {attempt + 1} attempts: {failure}")
+            delay = self._backoff(attempt, retry_after)
+            with self._lock:
+                self.retries += 1
+            if self.metrics is not None:
+                self.metrics.record_retry(len(payload))
+            print(f"Request failed ({failure}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def summary(self):
+        """One-line latency report for the end of a run."""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            retries = self.retries
+            cutoffs = dict(self.cutoffs)
+        if not latencies:
+            return f"Requests: 0 sent, {retries} retries"
+        average = sum(latencies) / len(latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        line = (f"Requests: {len(latencies)} sent, {retries} retries, "
+                f"latency avg {average:.2f}s / p95 {p95:.2f}s")
+        if any(cutoffs.values()):
+            line += f", streams cut at ### {cutoffs['marker']} / runaway {cutoffs['runaway']}"
+        return line
@@ -0,0 +1,111 @@
+"""
+Adaptive limit on how many requests are in flight at once.
+
+An AIMD controller: every window it compares completion tokens per second
+with the previous window. While throughput improves, or latency stays close
+to the best seen so far, the limit goes up by one. 429/503 responses,
+timeouts, or latency rising without a throughput gain cut it by
+decrease_factor. Producers call backlog() to see how much work is worth
+queueing, so they slow down together with the server.
+"""
+import threading
+import time
+
+
+class AdaptiveLimiter:
+    """Blocks _request callers beyond the current limit and moves the limit with the server's behaviour."""
+
+    def __init__(self, capacity, concurrency_config=None, metrics=None):
+        concurrency_config = concurrency_config or {}
+        self.adaptive = concurrency_config.get("adaptive", True)
+        if self.adaptive:
+            self.minimum = max(concurrency_config.get("minimum", 1), 1)
+            # 0 means 16, or more if the backends can take more at once
+            self.maximum = max(concurrency_config.get("maximum", 0) or max(16, capacity), self.minimum)
+            initial = concurrency_config.get("initial", 0) or capacity
+            self.limit = min(max(initial, self.minimum), self.maximum)
+        else:
+            self.minimum = self.maximum = self.limit = max(capacity, 1)
+        self.window_seconds = concurrency_config.get("window_seconds", 10)
+        self.decrease_factor = concurrency_config.get("decrease_factor", 0.5)
+        self.latency_tolerance = concurrency_config.get("latency_tolerance", 1.5)
+        self.metrics = metrics
+
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._reset_window(time.time())
+        self._previous_rate = None
+        self._best_latency = None
+        if metrics is not None:
+            metrics.record_concurrency(self.limit, "start")
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._window_tokens = 0
+        self._window_latencies = []
+        self._window_peak = self.in_flight
+        self._window_overloaded = False
+
+    def backlog(self):
+        """How many jobs producers should keep queued: enough that no slot ever waits for work."""
+        return self.limit * 2
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+            self._window_peak = max(self._window_peak, self.in_flight)
+
+    def release(self, latency=None, tokens=0):
+        """Give back a slot; latency and tokens are None/0 for a request that failed."""
+        with self._condition:
+            self.in_flight -= 1
+            if latency is not None:
+                self._window_latencies.append(latency)
+                self._window_tokens += tokens
+            if self.adaptive:
+                self._maybe_adjust()
+            self._condition.notify_all()
+
+    def overloaded(self):
+        """The server pushed back (429/503 or a timeout); the limit drops at the end of this window."""
+        with self._condition:
+            self._window_overloaded = True
+
+    def _set_limit(self, limit, reason):
+        limit = min(max(limit, self.minimum), self.maximum)
+        if limit == self.limit:
+            return
+        print(f"Concurrency {self.limit} -> {limit} ({reason})")
+        self.limit = limit
+        if self.metrics is not None:
+            self.metrics.record_concurrency(limit, reason)
+
+    def _maybe_adjust(self):
+        now = time.time()
+        elapsed = now - self._window_start
+        if elapsed < self.window_seconds:
+            return
+        latencies = self._window_latencies
+        if not latencies and not self._window_overloaded:
+            self._reset_window(now)
+            return
+
+        rate = self._window_tokens / elapsed
+        latency = sum(latencies) / len(latencies) if latencies else None
+        if latency is not None and (self._best_latency is None or latency < self._best_latency):
+            self._best_latency = latency
+        improved = self._previous_rate is None or rate > self._previous_rate * 1.05
+        slow = latency is not None and latency > self._best_latency * self.latency_tolerance
+        summary = f"{rate:.1f} tokens/s" + (f", latency {latency:.2f}s" if latency is not None else "")
+
+        if self._window_overloaded:
+            self._set_limit(int(self.limit * self.decrease_factor), f"server overloaded, {summary}")
+        elif slow and not improved:
+            self._set_limit(int(self.limit * self.decrease_factor), f"latency rising, {summary}")
+        elif self._window_peak >= self.limit and (improved or not slow):
+            # Only worth raising if the current limit was actually in use
+            self._set_limit(self.limit + 1, f"throughput {'improving' if improved else 'steady'}, {summary}")
+        self._previous_rate = rate
+        self._reset_window(now)
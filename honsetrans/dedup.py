@@ -0,0 +1,65 @@
+"""
+Translate each distinct source string once and fan the result out.
+
+Segments are grouped on a normalised form of their source text (Unicode
+NFKC, unified line breaks, no surrounding whitespace), one representative
+per group is translated, and every segment in the group gets that
+translation run through its own cleaner.
+"""
+import unicodedata
+
+from honsetrans.engine import Job, run_jobs
+
+
+def normalize_source(text):
+    """The key segments are deduplicated on."""
+    return unicodedata.normalize("NFKC", text).replace("\r\n", "\n").strip()
+
+
+class DedupIndex:
+    """Distinct normalised sources, each with the first original text seen and how often it occurs."""
+
+    def __init__(self):
+        self.sources = {}
+        self.counts = {}
+
+    def add(self, source):
+        key = normalize_source(source)
+        if key not in self.sources:
+            self.sources[key] = source
+            self.counts[key] = 0
+        self.counts[key] += 1
+        return key
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def __len__(self):
+        return len(self.sources)
+
+    def jobs(self, results):
+        """One job per distinct source that results has no translation for yet; results[key] gets the raw reply."""
+        return [Job(key, source, results, key) for key, source in self.sources.items() if key not in results]
+
+
+def run_deduplicated(jobs, translator, max_concurrency=1, batch_config=None, on_result=None):
+    """
+    Like run_jobs, but jobs with the same normalised source share one
+    request. on_result is still called once for every job in jobs.
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault(normalize_source(job.source), []).append(job)
+    translator.metrics.record_dedup(len(jobs), len(groups))
+
+    results = {}
+
+    def fan_out(representative):
+        for job in groups[representative.key]:
+            job.apply(results[representative.key])
+            if on_result is not None:
+                on_result(job)
+
+    representatives = [Job(key, group[0].source, results, key) for key, group in groups.items()]
+    run_jobs(representatives, translator, max_concurrency, batch_config, fan_out)
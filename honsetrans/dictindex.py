@@ -0,0 +1,137 @@
+"""
+Which segments use which dictionary.json entries, so fixing an entry only
+re-translates the lines it appears in.
+
+The index keeps every segment's source text and the dictionary keys found in
+it in SQLite: story segments by file path and segment key, character system
+texts by "char_id/text_id" under the character file's path. Files are only
+re-read when their size or modified time changed, and only segments whose
+source text changed are scanned again. Each script keeps its own snapshot of
+the dictionary it last ran with (its scope), and the diff against that
+snapshot says which keys changed.
+"""
+import json
+import os
+import sqlite3
+
+from honsetrans.glossary import Glossary
+
+
+def dictionary_diff(old, new):
+    """Keys that were added, removed or given a different translation."""
+    return {key for key in old.keys() | new.keys() if key and old.get(key) != new.get(key)}
+
+
+class DictionaryIndex:
+    """SQLite index from dictionary keys to the segments whose source contains them."""
+
+    def __init__(self, path, dictionary):
+        self.path = path
+        self.dictionary = dictionary
+        self.glossary = Glossary(dictionary)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS snapshots (scope TEXT PRIMARY KEY, dictionary TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, stat TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            "path TEXT, segment TEXT, source TEXT, PRIMARY KEY (path, segment)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT, path TEXT, segment TEXT)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS terms_term ON terms(term)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS terms_segment ON terms(path, segment)")
+        self._conn.commit()
+        self._sync_terms()
+
+    def _sync_terms(self):
+        """Bring the term rows in line with the current dictionary's keys."""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'terms'").fetchone()
+        indexed = set(json.loads(row[0])) if row is not None else set()
+        current = {key for key in self.dictionary if key}
+        for term in indexed - current:
+            self._conn.execute("DELETE FROM terms WHERE term = ?", (term,))
+        for term in current - indexed:
+            # A new key: find it in the stored sources instead of rescanning every segment
+            self._conn.execute(
+                "INSERT INTO terms (term, path, segment) "
+                "SELECT ?, path, segment FROM segments WHERE instr(source, ?) > 0",
+                (term, term),
+            )
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('terms', ?)",
+                           (json.dumps(sorted(current), ensure_ascii=False),))
+        self._conn.commit()
+
+    def _stat(self, file_path):
+        stat = os.stat(file_path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def is_fresh(self, file_path):
+        """True if file_path hasn't changed since it was last indexed."""
+        row = self._conn.execute("SELECT stat FROM files WHERE path = ?", (file_path,)).fetchone()
+        return row is not None and row[0] == self._stat(file_path)
+
+    def update_file(self, file_path, segments):
+        """
+        Index file_path from (segment key, source text) pairs. Only segments
+        that are new or whose source changed are scanned for terms. Returns
+        how many were.
+        """
+        scanned = 0
+        seen = set()
+        for segment, source in segments:
+            seen.add(segment)
+            row = self._conn.execute(
+                "SELECT source FROM segments WHERE path = ? AND segment = ?", (file_path, segment)
+            ).fetchone()
+            if row is not None and row[0] == source:
+                continue
+            scanned += 1
+            self._conn.execute("INSERT OR REPLACE INTO segments (path, segment, source) VALUES (?, ?, ?)",
+                               (file_path, segment, source))
+            self._conn.execute("DELETE FROM terms WHERE path = ? AND segment = ?", (file_path, segment))
+            self._conn.executemany("INSERT INTO terms (term, path, segment) VALUES (?, ?, ?)",
+                                   ((term, file_path, segment) for term in self.glossary.match(source)))
+        stored = self._conn.execute("SELECT segment FROM segments WHERE path = ?", (file_path,)).fetchall()
+        for (segment,) in stored:
+            if segment not in seen:
+                self._conn.execute("DELETE FROM segments WHERE path = ? AND segment = ?", (file_path, segment))
+                self._conn.execute("DELETE FROM terms WHERE path = ? AND segment = ?", (file_path, segment))
+        self.mark_fresh(file_path)
+        return scanned
+
+    def mark_fresh(self, file_path):
+        """Record file_path as indexed as it is now; for files rewritten without touching their sources."""
+        self._conn.execute("INSERT OR REPLACE INTO files (path, stat) VALUES (?, ?)",
+                           (file_path, self._stat(file_path)))
+        self._conn.commit()
+
+    def changed_keys(self, scope):
+        """Dictionary keys changed since scope's snapshot, or None if scope has no snapshot yet."""
+        row = self._conn.execute("SELECT dictionary FROM snapshots WHERE scope = ?", (scope,)).fetchone()
+        if row is None:
+            return None
+        return dictionary_diff(json.loads(row[0]), self.dictionary)
+
+    def save_snapshot(self, scope):
+        """Remember the current dictionary as the one scope's translations were made with."""
+        self._conn.execute("INSERT OR REPLACE INTO snapshots (scope, dictionary) VALUES (?, ?)",
+                           (scope, json.dumps(self.dictionary, ensure_ascii=False)))
+        self._conn.commit()
+
+    def affected(self, keys, file_paths=None):
+        """{file path: set of segment keys} whose source contains any of keys, limited to file_paths if given."""
+        result = {}
+        for key in keys:
+            if key in self.dictionary:
+                rows = self._conn.execute("SELECT path, segment FROM terms WHERE term = ?", (key,))
+            else:
+                # Removed from the dictionary, so it has no term rows any more
+                rows = self._conn.execute("SELECT path, segment FROM segments WHERE instr(source, ?) > 0", (key,))
+            for file_path, segment in rows:
+                if file_paths is None or file_path in file_paths:
+                    result.setdefault(file_path, set()).add(segment)
+        return result
+
+    def close(self):
+        self._conn.close()
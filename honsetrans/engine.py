@@ -0,0 +1,88 @@
+"""
+Run pending translations as independent jobs, optionally in parallel and batched.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from honsetrans.metrics import current_file, run_in_file
+from honsetrans.scheduling import make_groups
+
+
+class Job:
+    """A single pending translation and the slot its result is written to."""
+
+    def __init__(self, key, source, target, field, clean=None):
+        self.key = key
+        self.source = source
+        self.target = target
+        self.field = field
+        self.clean = clean
+
+    def apply(self, translated):
+        """Write the translated text back into its slot."""
+        if self.clean is not None:
+            translated = self.clean(translated)
+        self.target[self.field] = translated
+
+
+def translate_group(group, translator):
+    """Translate a group of jobs, batched if there is more than one; returns the results in order."""
+    if len(group) == 1:
+        return [translator.translate(group[0].source)]
+    results = translator.translate_batch([job.source for job in group])
+    # Only the segments the batch reply didn't cover go out again on their own; the batch
+    # already looked them up in the memory
+    return [translator.translate(job.source, lookup=False) if result is None else result
+            for job, result in zip(group, results)]
+
+
+def _apply_group(group, results, on_result):
+    for job, result in zip(group, results):
+        job.apply(result)
+        if on_result is not None:
+            on_result(job)
+
+
+def run_jobs(jobs, translator, max_concurrency=1, batch_config=None, on_result=None):
+    """
+    Translate every job and write each result back into its slot as soon as
+    it arrives; on_result, if given, is called with each finished job.
+
+    With max_concurrency above 1 the requests are sent from a thread pool so a
+    server with several parallel slots stays busy; only as many jobs as the
+    translator's limiter asks for are queued at a time. When batch_config is
+    enabled, jobs are packed into batched requests of at most max_segments
+    segments and max_chars source characters, or with the translator's
+    length buckets, by the limits of their bucket.
+    """
+    translator.metrics.expect(len(jobs))
+    groups = make_groups(jobs, batch_config, translator.buckets)
+
+    if max_concurrency <= 1:
+        for group in groups:
+            _apply_group(group, translate_group(group, translator), on_result)
+        return
+
+    # Requests made from the pool still count towards the caller's file
+    file_path = current_file.get()
+    pool = ThreadPoolExecutor(max_workers=max_concurrency)
+    remaining = iter(groups)
+    futures = {}
+
+    def submit():
+        # Backpressure: only queue as much as the limiter can currently keep busy
+        while len(futures) < translator.limiter.backlog():
+            group = next(remaining, None)
+            if group is None:
+                return
+            futures[pool.submit(run_in_file, file_path, translate_group, group, translator)] = group
+
+    try:
+        submit()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                _apply_group(futures.pop(future), future.result(), on_result)
+            submit()
+    finally:
+        # On an error or Ctrl-C, drop everything that hasn't started yet
+        pool.shutdown(cancel_futures=True)
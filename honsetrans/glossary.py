@@ -0,0 +1,62 @@
+"""
+Find which dictionary.json entries appear in a piece of source text.
+"""
+from collections import deque
+
+
+class Glossary:
+    """
+    Aho-Corasick automaton over the Japanese keys of dictionary.json.
+
+    Built once, then match() finds every key in a line with a single scan,
+    however many entries the dictionary has.
+    """
+
+    def __init__(self, dictionary):
+        self.dictionary = dictionary
+        self._order = {key: index for index, key in enumerate(dictionary)}
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for key in dictionary:
+            if not key:
+                continue
+            node = 0
+            for ch in key:
+                child = self._goto[node].get(ch)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][ch] = child
+                node = child
+            self._out[node].append(key)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def match(self, text):
+        """Return the dictionary keys found in text, in dictionary order."""
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            if self._out[node]:
+                found.update(self._out[node])
+        return sorted(found, key=self._order.__getitem__)
+
+    def entries(self, text):
+        """Return the japanese_text : english_text pairs that apply to text."""
+        return {key: self.dictionary[key] for key in self.match(text)}
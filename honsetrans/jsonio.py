@@ -0,0 +1,100 @@
+"""
+JSON reading and writing for all scripts, using orjson when it is installed.
+
+Output is byte-for-byte what json.dump(data, file, indent=4,
+ensure_ascii=False) writes, whichever backend produced it, so switching
+backends never shows up in diffs. Pick the backend with [json] backend in
+config.toml: "auto" (orjson if available), "orjson" or "stdlib".
+"""
+import json
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = ("auto", "orjson", "stdlib")
+
+_backend = "auto"
+
+
+def set_backend(name):
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    if name == "orjson" and orjson is None:
+        raise ImportError("JSON backend 'orjson' selected but orjson is not installed (pip install orjson)")
+    _backend = name
+
+
+def get_backend():
+    return _backend
+
+
+def configure(config):
+    """Apply the [json] section of a loaded config.toml."""
+    set_backend(config.get("json", {}).get("backend", "auto"))
+
+
+def _use_orjson():
+    return orjson is not None and _backend != "stdlib"
+
+
+def _orjson_compatible(value):
+    """
+    True if orjson formats every number in value the way json does: floats
+    needing an exponent, NaN/Infinity and integers beyond 64 bits differ.
+    """
+    kind = type(value)
+    if kind is dict:
+        return all(_orjson_compatible(item) for item in value.values())
+    if kind is list:
+        return all(_orjson_compatible(item) for item in value)
+    if kind is float:
+        return value == 0 or (math.isfinite(value) and 1e-4 <= abs(value) < 1e16)
+    if kind is int:
+        return -2 ** 63 <= value < 2 ** 64
+    return True
+
+
+def _reindent(data):
+    """Turn orjson's 2-space indentation into json's 4-space indentation."""
+    depth = 0
+    while b"\n" + b"  " * (depth + 1) in data:
+        depth += 1
+    # Deepest first, tagging each rewritten line with a NUL (which never
+    # appears raw in JSON output) so shallower passes don't match it again
+    for level in range(depth, 0, -1):
+        data = data.replace(b"\n" + b"  " * level, b"\n\0" + b"    " * level)
+    return data.replace(b"\n\0", b"\n")
+
+
+def loads(data):
+    if _use_orjson():
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN, integers orjson can't hold, ...: let json decide
+            pass
+    return json.loads(data)
+
+
+def load(file_path):
+    with open(file_path, "rb") as file:
+        return loads(file.read())
+
+
+def dumps(data):
+    """Serialise data as UTF-8 bytes in the repo's indent=4, ensure_ascii=False format."""
+    if _use_orjson() and _orjson_compatible(data):
+        try:
+            return _reindent(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(data, indent=4, ensure_ascii=False).encode("utf-8")
+
+
+def dump(data, file_path):
+    with open(file_path, "wb") as file:
+        file.write(dumps(data))
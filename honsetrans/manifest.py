@@ -0,0 +1,74 @@
+"""
+Index of story files and how much of each is still untranslated.
+
+Lets transLoop skip finished files with a stat() call instead of parsing them.
+"""
+import hashlib
+import os
+
+from honsetrans import jsonio
+from honsetrans.checkpoint import atomic_write_json
+
+
+def file_hash(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+class Manifest:
+    """
+    Maps each file path to its size, mtime, content hash and the number of
+    segments still pending when it was last processed.
+    """
+
+    def __init__(self, path, autosave_every=50):
+        self.path = path
+        self.autosave_every = autosave_every
+        self.entries = {}
+        self._dirty = False
+        self._updates = 0
+        if os.path.exists(path):
+            self.entries = jsonio.load(path)
+
+    def known_pending(self, file_path):
+        """
+        Pending segment count recorded for file_path, or None if it is new or
+        has changed since. The file is only read if its size or mtime moved,
+        to check whether the content really changed.
+        """
+        entry = self.entries.get(file_path)
+        if entry is None:
+            return None
+        stat = os.stat(file_path)
+        if stat.st_size != entry["size"]:
+            return None
+        if stat.st_mtime_ns != entry["mtime_ns"]:
+            if file_hash(file_path) != entry["sha256"]:
+                return None
+            # Touched but not modified
+            entry["mtime_ns"] = stat.st_mtime_ns
+            self._dirty = True
+        return entry["pending"]
+
+    def is_complete(self, file_path):
+        """True if file_path had nothing left to translate last time and hasn't changed since."""
+        return self.known_pending(file_path) == 0
+
+    def update(self, file_path, pending):
+        """Record file_path as it is on disk now, with pending segments left."""
+        stat = os.stat(file_path)
+        self.entries[file_path] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_hash(file_path),
+            "pending": pending,
+        }
+        self._dirty = True
+        self._updates += 1
+        if self.autosave_every and self._updates % self.autosave_every == 0:
+            self.save()
+
+    def save(self):
+        if self._dirty:
+            atomic_write_json(self.path, self.entries)
+            self._dirty = False
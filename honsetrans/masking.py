@@ -0,0 +1,103 @@
+"""
+Template masking: lines that only differ in a name, a number or a tag share
+one translation.
+
+Dictionary names, digit runs and <tag>/%placeholder tokens are swapped for
+typed placeholders ({N1}, {D1}, {T1}) before the translation memory lookup
+and the request. The translated template is filled back in with the English
+dictionary value, the number or the tag itself. A reply whose placeholders
+don't match the template can't be filled in safely and has to be sent again
+unmasked.
+"""
+import re
+import unicodedata
+
+PLACEHOLDER = re.compile(r"\{([NDT])(\d+)\}")
+TAG_PATTERN = r"</?[A-Za-z_][^<>\s]*>|%[A-Za-z_][A-Za-z0-9_]*"
+DIGIT_PATTERN = r"[0-9０-９]+"
+ORDINAL = re.compile(r"\{D(\d+)\}(st|nd|rd|th)\b")
+
+MASK_INSTRUCTIONS = (
+    " The text may contain placeholders such as {N1}, {D1} or {T1} standing for"
+    " names, numbers and tags. Keep every placeholder exactly as written."
+)
+
+
+def ordinal_suffix(number):
+    if 10 <= number % 100 <= 20:
+        return "th"
+    return {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+
+
+class MaskedText:
+    """A template and the values its placeholders stand for."""
+
+    def __init__(self, template, values):
+        self.template = template
+        self.values = values
+
+    @property
+    def masked(self):
+        return bool(self.values)
+
+    def fill(self, translation):
+        """
+        Put the values back into a translated template, or return None if
+        its placeholders aren't exactly the template's.
+        """
+        if set(PLACEHOLDER.findall(translation)) != set(PLACEHOLDER.findall(self.template)):
+            return None
+
+        def ordinal(match):
+            # "{D1}th" filled with 1 has to become "1st"
+            value = self.values[f"{{D{match.group(1)}}}"]
+            return f"{value}{ordinal_suffix(int(value))}" if value.isdigit() else match.group(0)
+
+        translation = ORDINAL.sub(ordinal, translation)
+        return PLACEHOLDER.sub(lambda match: self.values[match.group(0)], translation)
+
+
+class Masker:
+    """Finds the maskable parts of a line with one regex built from the dictionary."""
+
+    def __init__(self, dictionary, masking_config=None):
+        masking_config = masking_config or {}
+        self.dictionary = dictionary
+        alternatives = []
+        if masking_config.get("tags", True):
+            alternatives.append(f"(?P<T>{TAG_PATTERN})")
+        if masking_config.get("names", True):
+            # Longest first, so a full name wins over a name it contains
+            names = sorted((key for key in dictionary if key and dictionary[key]), key=len, reverse=True)
+            if names:
+                alternatives.append(f"(?P<N>{'|'.join(re.escape(name) for name in names)})")
+        if masking_config.get("digits", True):
+            alternatives.append(f"(?P<D>{DIGIT_PATTERN})")
+        self.pattern = re.compile("|".join(alternatives)) if alternatives else None
+
+    def mask(self, text):
+        """Return the MaskedText for text; nothing is masked if it has no names, numbers or tags."""
+        if self.pattern is None or PLACEHOLDER.search(text):
+            # Text that already looks like a template can't be told apart from one
+            return MaskedText(text, {})
+        values = {}
+        tokens = {}
+
+        def replace(match):
+            kind = match.lastgroup
+            found = match.group(0)
+            if kind == "N":
+                value = self.dictionary[found].strip()
+            elif kind == "D":
+                value = unicodedata.normalize("NFKC", found)
+            else:
+                value = found
+            token = tokens.get((kind, value))
+            if token is None:
+                count = sum(1 for key in tokens if key[0] == kind) + 1
+                token = tokens[(kind, value)] = f"{{{kind}{count}}}"
+                values[token] = value
+            return token
+
+        template = self.pattern.sub(replace, text)
+        return MaskedText(template, values)
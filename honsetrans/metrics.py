@@ -0,0 +1,381 @@
+"""
+Per-request metrics, progress reporting and machine-readable run reports.
+
+Every request the client sends is recorded here (latency, time to first
+token, token usage and bytes on the wire) together with cache hits and
+retries. Requests are attributed to the story file they were made for
+through the current_file context variable, which run_jobs and the file
+pipeline carry over into their worker threads.
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+current_file = contextvars.ContextVar("current_file", default=None)
+
+
+@contextlib.contextmanager
+def file_scope(file_path):
+    """Attribute everything recorded inside the block to file_path."""
+    token = current_file.set(file_path)
+    try:
+        yield
+    finally:
+        current_file.reset(token)
+
+
+def run_in_file(file_path, fn, *args):
+    """Call fn(*args) inside file_scope(file_path); for handing work to pool threads."""
+    with file_scope(file_path):
+        return fn(*args)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Histogram:
+    """Cumulative-bucket histogram that also keeps the raw samples for percentiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.samples = []
+
+    def observe(self, value):
+        self.samples.append(value)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def as_dict(self):
+        samples = self.samples
+        result = {"count": len(samples), "sum": round(sum(samples), 6)}
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            value = percentile(samples, fraction)
+            result[name] = None if value is None else round(value, 4)
+        result["buckets"] = {str(bound): count for bound, count in zip(self.buckets, self.counts)}
+        return result
+
+
+class FileStats:
+    """Counters for one story file."""
+
+    def __init__(self):
+        self.segments = 0
+        self.cache_hits = 0
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.request_seconds = 0.0
+        self.first_seen = time.time()
+        self.last_seen = self.first_seen
+
+    def as_dict(self):
+        return {
+            "segments": self.segments,
+            "cache_hits": self.cache_hits,
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "request_seconds": round(self.request_seconds, 3),
+            "wall_seconds": round(self.last_seen - self.first_seen, 3),
+        }
+
+
+class RunMetrics:
+    """
+    Thread-safe collector for one run.
+
+    With verbose off, the per-segment prints are replaced by a progress line
+    with an ETA printed at most every progress_interval seconds. At the end
+    of the run write_report() saves everything to the [metrics] report path,
+    as JSON or, for a .prom path, as a Prometheus textfile.
+    """
+
+    def __init__(self, metrics_config=None):
+        metrics_config = metrics_config or {}
+        self.verbose = metrics_config.get("verbose", False)
+        self.progress_interval = metrics_config.get("progress_interval", 5.0)
+        self.report_path = metrics_config.get("report", "run_report.json")
+        self.started = time.time()
+        self.latency = Histogram()
+        self.ttft = Histogram()
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.cache_hits = 0
+        self.segments_expected = 0
+        self.segments_done = 0
+        self.dedup_segments = 0
+        self.dedup_unique = 0
+        self.concurrency_history = []
+        self.validation_failures = {}
+        self.validation_retries = 0
+        self.validation_unresolved = 0
+        self.files = {}
+        self._last_progress = 0.0
+        self._lock = threading.Lock()
+
+    def _file(self):
+        file_path = current_file.get()
+        if file_path is None:
+            return None
+        stats = self.files.get(file_path)
+        if stats is None:
+            stats = self.files[file_path] = FileStats()
+        stats.last_seen = time.time()
+        return stats
+
+    def record_request(self, latency, sent_bytes, received_bytes, usage=None, ttft=None):
+        """Record one successful request and the usage block of its response."""
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        with self._lock:
+            self.requests += 1
+            self.latency.observe(latency)
+            if ttft is not None:
+                self.ttft.observe(ttft)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.bytes_sent += sent_bytes
+            self.bytes_received += received_bytes
+            stats = self._file()
+            if stats is not None:
+                stats.requests += 1
+                stats.prompt_tokens += prompt_tokens
+                stats.completion_tokens += completion_tokens
+                stats.request_seconds += latency
+
+    def record_retry(self, sent_bytes=0):
+        with self._lock:
+            self.retries += 1
+            self.bytes_sent += sent_bytes
+
+    def record_failure(self):
+        """A request that ran out of retries."""
+        with self._lock:
+            self.failures += 1
+
+    def record_dedup(self, segments, unique):
+        """segments pending segments were covered by unique distinct source strings."""
+        with self._lock:
+            self.dedup_segments += segments
+            self.dedup_unique += unique
+
+    def _dedup_ratio(self):
+        return round(self.dedup_segments / self.dedup_unique, 3) if self.dedup_unique else None
+
+    def record_concurrency(self, limit, reason):
+        """The adaptive limiter settled on a new number of requests in flight."""
+        with self._lock:
+            self.concurrency_history.append({
+                "seconds": round(time.time() - self.started, 3),
+                "limit": limit,
+                "reason": reason,
+            })
+
+    def record_validation(self, failed):
+        """A translation broke the validation rules named in failed."""
+        with self._lock:
+            for rule in failed:
+                self.validation_failures[rule] = self.validation_failures.get(rule, 0) + 1
+
+    def record_validation_retry(self):
+        with self._lock:
+            self.validation_retries += 1
+
+    def record_unresolved(self):
+        """A segment still failed validation after its last retry and was kept as it was."""
+        with self._lock:
+            self.validation_unresolved += 1
+
+    def expect(self, segments):
+        """Add segments to the total the progress line counts towards."""
+        with self._lock:
+            self.segments_expected += segments
+
+    def record_segment(self, cached=False):
+        """One segment has its translation, from the cache or the server."""
+        with self._lock:
+            self.segments_done += 1
+            if cached:
+                self.cache_hits += 1
+            stats = self._file()
+            if stats is not None:
+                stats.segments += 1
+                if cached:
+                    stats.cache_hits += 1
+            now = time.time()
+            if self.verbose or now - self._last_progress < self.progress_interval:
+                return
+            self._last_progress = now
+            line = self._progress_line(now)
+        print(line, flush=True)
+
+    def _progress_line(self, now):
+        done = self.segments_done
+        total = max(self.segments_expected, done)
+        elapsed = now - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        line = f"Progress: {done}/{total} segments ({done / total:.0%}), {rate:.1f} segments/s"
+        if self.cache_hits:
+            line += f", {self.cache_hits} from cache"
+        if rate > 0 and total > done:
+            remaining = int((total - done) / rate)
+            line += f", ETA {remaining // 3600}:{remaining // 60 % 60:02d}:{remaining % 60:02d}"
+        return line
+
+    def file_summary(self, file_path):
+        """One line about file_path, or None if nothing was recorded for it."""
+        with self._lock:
+            stats = self.files.get(file_path)
+            if stats is None:
+                return None
+            return (f"{file_path}: {stats.segments} segments ({stats.cache_hits} cached), "
+                    f"{stats.requests} requests, {stats.prompt_tokens} prompt / "
+                    f"{stats.completion_tokens} completion tokens, "
+                    f"{stats.last_seen - stats.first_seen:.1f}s")
+
+    def report(self):
+        """Everything recorded so far as a JSON-ready dict."""
+        with self._lock:
+            elapsed = time.time() - self.started
+            return {
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "wall_seconds": round(elapsed, 3),
+                "segments": self.segments_done,
+                "segments_per_second": round(self.segments_done / elapsed, 3) if elapsed > 0 else None,
+                "cache_hits": self.cache_hits,
+                "requests": self.requests,
+                "failures": self.failures,
+                "retries": self.retries,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "latency_seconds": self.latency.as_dict(),
+                "ttft_seconds": self.ttft.as_dict(),
+                "dedup": {
+                    "segments": self.dedup_segments,
+                    "unique": self.dedup_unique,
+                    "ratio": self._dedup_ratio(),
+                },
+                "concurrency_history": list(self.concurrency_history),
+                "validation": {
+                    "failures": dict(self.validation_failures),
+                    "retries": self.validation_retries,
+                    "unresolved": self.validation_unresolved,
+                },
+                "files": {path: stats.as_dict() for path, stats in self.files.items()},
+            }
+
+    def summary(self):
+        """Lines about tokens, bytes and time to first token, printed at the end of a run."""
+        with self._lock:
+            lines = [f"Tokens: {self.prompt_tokens} prompt / {self.completion_tokens} completion, "
+                     f"{self.bytes_sent / 1024:.0f} KiB sent / {self.bytes_received / 1024:.0f} KiB received"]
+            if self.dedup_unique:
+                lines.append(f"Dedup: {self.dedup_segments} segments shared {self.dedup_unique} unique strings "
+                             f"(ratio {self._dedup_ratio():.2f}, "
+                             f"{self.dedup_segments - self.dedup_unique} translations reused)")
+            if len(self.concurrency_history) > 1:
+                limits = [entry["limit"] for entry in self.concurrency_history]
+                lines.append(f"Concurrency: started at {limits[0]}, ended at {limits[-1]}, "
+                             f"range {min(limits)}-{max(limits)} over {len(limits) - 1} changes")
+            if self.validation_failures:
+                rules = ", ".join(f"{rule} {count}" for rule, count in sorted(self.validation_failures.items()))
+                lines.append(f"Validation: {sum(self.validation_failures.values())} rule failures ({rules}), "
+                             f"{self.validation_retries} retries, {self.validation_unresolved} segments kept unresolved")
+            if self.ttft.samples:
+                lines.append(f"Time to first token: avg {sum(self.ttft.samples) / len(self.ttft.samples):.2f}s"
+                             f" / p95 {percentile(self.ttft.samples, 0.95):.2f}s")
+        return lines
+
+    def write_report(self, path=None):
+        """Save report() to path (default: the configured report path); returns the path, or None if disabled."""
+        path = path or self.report_path
+        if not path:
+            return None
+        report = self.report()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            if path.endswith(".prom"):
+                file.write(prometheus_text(report))
+            else:
+                json.dump(report, file, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(report):
+    """Render report() in the Prometheus textfile exposition format."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP honsetrans_{name} {help_text}")
+        lines.append(f"# TYPE honsetrans_{name} {kind}")
+        for suffix, labels, value in samples:
+            label_text = "{" + ",".join(f'{key}="{_label(val)}"' for key, val in labels.items()) + "}" if labels else ""
+            lines.append(f"honsetrans_{name}{suffix}{label_text} {value}")
+
+    counters = (
+        ("segments_total", "segments", "Segments translated, including cache hits"),
+        ("cache_hits_total", "cache_hits", "Segments answered from the translation memory"),
+        ("requests_total", "requests", "Chat completion requests that succeeded"),
+        ("request_failures_total", "failures", "Requests that failed after every retry"),
+        ("request_retries_total", "retries", "Requests that were retried"),
+        ("prompt_tokens_total", "prompt_tokens", "Prompt tokens reported by the server"),
+        ("completion_tokens_total", "completion_tokens", "Completion tokens reported by the server"),
+        ("bytes_sent_total", "bytes_sent", "Request body bytes sent"),
+        ("bytes_received_total", "bytes_received", "Response body bytes received"),
+    )
+    for name, key, help_text in counters:
+        metric(name, "counter", help_text, [("", {}, report[key])])
+    metric("run_seconds", "gauge", "Wall time of the run so far", [("", {}, report["wall_seconds"])])
+    if report["concurrency_history"]:
+        metric("concurrency_limit", "gauge", "Requests allowed in flight at the end of the run",
+               [("", {}, report["concurrency_history"][-1]["limit"])])
+    metric("validation_failures_total", "counter", "Translations that broke a validation rule",
+           [("", {"rule": rule}, count) for rule, count in sorted(report["validation"]["failures"].items())])
+    metric("validation_retries_total", "counter", "Segments sent again after failing validation",
+           [("", {}, report["validation"]["retries"])])
+    metric("validation_unresolved_total", "counter", "Segments still failing validation after every retry",
+           [("", {}, report["validation"]["unresolved"])])
+    metric("dedup_segments_total", "counter", "Pending segments that went through deduplication",
+           [("", {}, report["dedup"]["segments"])])
+    metric("dedup_unique_total", "counter", "Distinct source strings those segments reduced to",
+           [("", {}, report["dedup"]["unique"])])
+
+    for name, key, help_text in (("request_latency_seconds", "latency_seconds", "Request latency"),
+                                 ("ttft_seconds", "ttft_seconds", "Time to first streamed token")):
+        histogram = report[key]
+        samples = [("_bucket", {"le": bound}, count) for bound, count in histogram["buckets"].items()]
+        samples.append(("_bucket", {"le": "+Inf"}, histogram["count"]))
+        samples.append(("_sum", {}, histogram["sum"]))
+        samples.append(("_count", {}, histogram["count"]))
+        metric(name, "histogram", help_text, samples)
+
+    for name, key, help_text in (("file_segments_total", "segments", "Segments translated per file"),
+                                 ("file_requests_total", "requests", "Requests sent per file"),
+                                 ("file_wall_seconds", "wall_seconds", "Time spent on each file")):
+        metric(name, "gauge" if name.endswith("seconds") else "counter", help_text,
+               [("", {"file": path}, stats[key]) for path, stats in report["files"].items()])
+    return "\n".join(lines) + "\n"
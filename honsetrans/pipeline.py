@@ -0,0 +1,265 @@
+"""
+File-level scheduling for transLoop.
+
+Files are parsed ahead of time in worker processes, every loaded file's
+segments go into one shared translation pool, and finished files are written
+by a separate writer thread, so JSON parsing and writing overlap with the
+network waits of other files.
+
+With dedup, a line whose normalised text was already translated this run is
+filled in straight away, and one that is still on its way waits for that
+request instead of sending its own, so each distinct line costs one request
+across all files.
+"""
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from honsetrans import jsonio
+from honsetrans.checkpoint import Checkpoint
+from honsetrans.dedup import normalize_source
+from honsetrans.engine import Job, translate_group
+from honsetrans.metrics import run_in_file
+from honsetrans.scheduling import make_groups
+from honsetrans.segments import count_pending
+
+
+def load_json(file_path):
+    return jsonio.load(file_path)
+
+
+def count_pending_in_file(file_path):
+    """Worker-process helper: how many segments file_path has left to translate."""
+    return count_pending(load_json(file_path))
+
+
+class _FileState:
+    def __init__(self, file_path, data, checkpoint):
+        self.file_path = file_path
+        self.data = data
+        self.checkpoint = checkpoint
+        self.outstanding = 0
+        self.failed = False
+        self.changed = False
+
+
+class FilePipeline:
+    """
+    Translates many story files at once.
+
+    prepare(data) returns the jobs for a loaded file, and on_written(path,
+    pending) is called from the writer thread after each file is saved.
+    dedup, if given, is the Checkpoint of a {normalised source: raw reply}
+    dict that finished lines are shared through.
+    """
+
+    def __init__(self, translator, prepare, on_written=None, pipeline_config=None,
+                 batch_config=None, checkpoint_config=None, dedup=None):
+        pipeline_config = pipeline_config or {}
+        self.translator = translator
+        self.prepare = prepare
+        self.on_written = on_written
+        self.order = pipeline_config.get("order", "largest")
+        self.prefetch = max(pipeline_config.get("prefetch", 4), 1)
+        self.parse_workers = max(pipeline_config.get("parse_workers", 2), 1)
+        self.batch_config = batch_config or {}
+        self.checkpoint_config = checkpoint_config
+        self.dedup = dedup
+        self.failed_files = []
+        self.pending_counts = {}
+
+    def schedule(self, file_paths, known_pending=None):
+        """
+        Order file_paths by pending segment count (largest or smallest first),
+        or keep the given order for order = "walk". Counts in known_pending
+        are trusted, the rest are counted in worker processes. Files with
+        nothing pending are left out and passed to on_written as they are.
+        """
+        if self.order not in ("largest", "smallest"):
+            self.pending_counts = dict(known_pending or {})
+            return list(file_paths)
+        pending = dict(known_pending or {})
+        unknown = [path for path in file_paths if path not in pending]
+        if unknown:
+            with ProcessPoolExecutor(max_workers=self.parse_workers, initializer=jsonio.set_backend,
+                                     initargs=(jsonio.get_backend(),)) as pool:
+                for path, count in zip(unknown, pool.map(count_pending_in_file, unknown, chunksize=16)):
+                    pending[path] = count
+        ordered = []
+        for path in file_paths:
+            if pending[path] > 0:
+                ordered.append(path)
+            elif self.on_written is not None:
+                self.on_written(path, 0)
+        ordered.sort(key=pending.__getitem__, reverse=self.order == "largest")
+        self.pending_counts = pending
+        return ordered
+
+    def _writer(self, written):
+        while True:
+            state = written.get()
+            if state is None:
+                return
+            pending = count_pending(state.data)
+            if state.changed:
+                state.checkpoint.save()
+                print(f"Wrote translated data to {state.file_path} ({pending} segments still pending)")
+                file_summary = self.translator.metrics.file_summary(state.file_path)
+                if file_summary:
+                    print(f"  {file_summary}")
+            if self.on_written is not None and not state.failed:
+                self.on_written(state.file_path, pending)
+
+    def _groups(self, jobs):
+        return make_groups(jobs, self.batch_config, self.translator.buckets)
+
+    def _share(self, state, jobs, subscribers, shared, seen):
+        """
+        Fill in the jobs dedup already has a result for and attach the rest to
+        the request that will answer them, subscribers mapping each request
+        job to the (state, job) pairs waiting on it. Returns the request jobs
+        that have to be sent.
+        """
+        fresh = []
+        unique = len(seen)
+        for job in jobs:
+            request = job
+            if self.dedup is not None:
+                key = normalize_source(job.source)
+                seen.add(key)
+                if key in self.dedup.data:
+                    job.apply(self.dedup.data[key])
+                    state.checkpoint.record(job)
+                    continue
+                request = shared.get(key)
+                if request is None:
+                    request = shared[key] = Job(key, job.source, self.dedup.data, key)
+                    fresh.append(request)
+            else:
+                fresh.append(job)
+            subscribers.setdefault(id(request), []).append((state, job))
+            state.outstanding += 1
+        if self.dedup is not None:
+            self.translator.metrics.record_dedup(len(jobs), len(seen) - unique)
+        return fresh
+
+    def run(self, file_paths):
+        """Translate and write every file in file_paths, in that order of priority."""
+        file_paths = list(file_paths)
+        events = queue.Queue()
+        written = queue.Queue()
+        writer = threading.Thread(target=self._writer, args=(written,), daemon=True)
+        writer.start()
+
+        loader = ProcessPoolExecutor(max_workers=self.parse_workers, initializer=jsonio.set_backend,
+                                     initargs=(jsonio.get_backend(),))
+        pool = ThreadPoolExecutor(max_workers=self.translator.max_concurrency)
+        limiter = self.translator.limiter
+        next_file = 0
+        loading = 0
+        active = 0
+        waiting = deque()
+        in_pool = 0
+        # Request job id -> jobs it answers; with dedup, normalised source ->
+        # request in flight, and every normalised source seen this run
+        subscribers = {}
+        shared = {}
+        seen = set()
+
+        def submit_loads():
+            nonlocal next_file, loading
+            # Backpressure: don't parse more files while there's already a queue of work
+            while (next_file < len(file_paths) and loading + active < self.prefetch
+                   and len(waiting) < limiter.backlog()):
+                path = file_paths[next_file]
+                next_file += 1
+                loading += 1
+                future = loader.submit(load_json, path)
+                future.add_done_callback(lambda done, path=path: events.put(("loaded", path, done)))
+
+        def submit_groups():
+            nonlocal in_pool
+            while waiting and in_pool < limiter.backlog():
+                state, group = waiting.popleft()
+                in_pool += 1
+                translation = pool.submit(run_in_file, state.file_path, translate_group, group, self.translator)
+                translation.add_done_callback(
+                    lambda done, state=state, group=group: events.put(("translated", state, group, done)))
+
+        # Counts from schedule() give the progress line a total up front, the
+        # rest is added (or corrected) as each file is loaded
+        metrics = self.translator.metrics
+        metrics.expect(sum(self.pending_counts.get(path, 0) for path in file_paths))
+
+        def finish_job(state):
+            nonlocal active
+            state.outstanding -= 1
+            if not state.outstanding:
+                active -= 1
+                written.put(state)
+
+        try:
+            submit_loads()
+            while loading or active:
+                event = events.get()
+                if event[0] == "loaded":
+                    _, path, future = event
+                    loading -= 1
+                    try:
+                        data = future.result()
+                    except (OSError, ValueError) as error:
+                        print(f"Failed to load {path}: {error}")
+                        self.failed_files.append(path)
+                        metrics.expect(-self.pending_counts.get(path, 0))
+                        submit_loads()
+                        continue
+                    print(f"Loaded {path}")
+                    checkpoint = Checkpoint(path, data, self.checkpoint_config)
+                    jobs = self.prepare(data)
+                    state = _FileState(path, data, checkpoint)
+                    state.changed = bool(jobs)
+                    jobs = checkpoint.replay(jobs)
+                    fresh = self._share(state, jobs, subscribers, shared, seen)
+                    # Only lines that go out in a request count towards the progress line
+                    metrics.expect(len(fresh) - self.pending_counts.get(path, 0))
+                    if not state.outstanding:
+                        written.put(state)
+                    else:
+                        active += 1
+                        for group in self._groups(fresh):
+                            waiting.append((state, group))
+                else:
+                    _, state, group, future = event
+                    in_pool -= 1
+                    try:
+                        results = future.result()
+                    except Exception as error:
+                        for request in group:
+                            if self.dedup is not None:
+                                del shared[request.key]
+                            for waiter, job in subscribers.pop(id(request)):
+                                if not waiter.failed:
+                                    print(f"Failed to translate {waiter.file_path}: {error}")
+                                    self.failed_files.append(waiter.file_path)
+                                waiter.failed = True
+                                finish_job(waiter)
+                    else:
+                        # Results are applied here, on the main thread, so the
+                        # writer never sees a file that is still changing
+                        for request, result in zip(group, results):
+                            if self.dedup is not None:
+                                del shared[request.key]
+                                request.apply(result)
+                                self.dedup.record(request)
+                            for waiter, job in subscribers.pop(id(request)):
+                                job.apply(result)
+                                waiter.checkpoint.record(job)
+                                finish_job(waiter)
+                submit_groups()
+                submit_loads()
+        finally:
+            pool.shutdown(cancel_futures=True)
+            loader.shutdown(cancel_futures=True)
+            written.put(None)
+            writer.join()
@@ -0,0 +1,156 @@
+"""
+Dry-run planning: size up a run before any request is sent.
+
+Pending segments are fed to a Planner, which counts them, finds the unique
+source strings and estimates prompt and completion tokens (with and without
+the glossary filter) and the wall time of translating them.
+"""
+import json
+import os
+
+from honsetrans.batching import BATCH_INSTRUCTIONS, build_batch_payload
+from honsetrans.engine import Job
+from honsetrans.glossary import Glossary
+from honsetrans.masking import Masker
+from honsetrans.scheduling import LengthBuckets, make_groups
+from honsetrans.tokens import approx_tokens
+from honsetrans.translator import build_system_prompt
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def measured_throughput(report_path):
+    """(completion tokens/s, segments/s) from a previous run's JSON report, or (None, None)."""
+    if not report_path or report_path.endswith(".prom") or not os.path.exists(report_path):
+        return None, None
+    try:
+        with open(report_path, "r", encoding="utf-8") as file:
+            report = json.load(file)
+    except ValueError:
+        return None, None
+    wall = report.get("wall_seconds") or 0
+    if wall <= 0:
+        return None, None
+    tokens = report.get("completion_tokens") or 0
+    segments = report.get("segments") or 0
+    return (tokens / wall if tokens else None), (segments / wall if segments else None)
+
+
+class Planner:
+    """Collects pending segments and estimates what translating them will cost."""
+
+    def __init__(self, config, dictionary):
+        self.server = config["server"]
+        self.batch_config = config.get("batch", {})
+        self.cache_enabled = config.get("cache", {}).get("enabled", True)
+        self.glossary_enabled = config.get("glossary", {}).get("filter", True)
+        plan_config = config.get("plan", {})
+        self.tokens_per_second = plan_config.get("tokens_per_second", 0)
+        self.completion_ratio = plan_config.get("completion_ratio", 1.0)
+        self.report_path = config.get("metrics", {}).get("report", "run_report.json")
+        self.dictionary_json_str = json.dumps(dictionary, ensure_ascii=False)
+        self.glossary = Glossary(dictionary)
+        masking_config = config.get("masking", {})
+        self.masker = Masker(dictionary, masking_config) if masking_config.get("enabled", True) else None
+        scheduling_config = config.get("scheduling", {})
+        self.buckets = LengthBuckets(scheduling_config) if scheduling_config.get("enabled", True) else None
+        self.counts = {}
+        self.sources = {}
+
+    def add(self, kind, source):
+        """Count one pending slot of the given kind."""
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        self.sources[source] = self.sources.get(source, 0) + 1
+
+    @property
+    def pending(self):
+        return sum(self.counts.values())
+
+    def _requests(self, texts):
+        """(requests, prompt tokens with the full dictionary, with the glossary filter) for texts."""
+        jobs = [Job(None, text, None, None) for text in texts]
+        groups = [[job.source for job in group] for group in make_groups(jobs, self.batch_config, self.buckets)]
+
+        full_system = approx_tokens(build_system_prompt(self.server["system_prompt"], self.dictionary_json_str))
+        empty_system = approx_tokens(build_system_prompt(self.server["system_prompt"], ""))
+        full_tokens = 0
+        glossary_tokens = 0
+        for group in groups:
+            if len(group) == 1:
+                user_tokens = approx_tokens(group[0])
+                extra = 0
+            else:
+                user_tokens = approx_tokens(build_batch_payload(group))
+                extra = approx_tokens(BATCH_INSTRUCTIONS)
+            entries = json.dumps(self.glossary.entries("\n".join(group)), ensure_ascii=False)
+            full_tokens += full_system + extra + user_tokens
+            glossary_tokens += empty_system + approx_tokens(entries) + extra + user_tokens
+        return len(groups), full_tokens, glossary_tokens
+
+    def report(self):
+        """The plan as a dict."""
+        # The translation memory answers repeats of a string, so only unique ones cost a request
+        texts = list(self.sources) if self.cache_enabled else [
+            text for text, count in self.sources.items() for _ in range(count)]
+        requests, full_tokens, glossary_tokens = self._requests(texts)
+        completion_tokens = int(sum(approx_tokens(text) for text in texts) * self.completion_ratio)
+
+        tokens_per_second = self.tokens_per_second
+        segments_per_second = None
+        source = "[plan] tokens_per_second"
+        if not tokens_per_second:
+            tokens_per_second, segments_per_second = measured_throughput(self.report_path)
+            source = f"measured in {self.report_path}"
+        if tokens_per_second:
+            wall_seconds = completion_tokens / tokens_per_second
+        elif segments_per_second:
+            wall_seconds = self.pending / segments_per_second
+        else:
+            wall_seconds = None
+
+        return {
+            "pending_segments": self.pending,
+            "by_kind": dict(self.counts),
+            "unique_sources": len(self.sources),
+            "duplicates": self.pending - len(self.sources),
+            "unique_templates": (len({self.masker.mask(text).template for text in self.sources})
+                                 if self.masker is not None else None),
+            "requests": requests,
+            "prompt_tokens_full_dictionary": full_tokens,
+            "prompt_tokens_glossary": glossary_tokens,
+            "glossary_filter": self.glossary_enabled,
+            "completion_tokens": completion_tokens,
+            "tokens_per_second": tokens_per_second,
+            "segments_per_second": segments_per_second,
+            "throughput_source": source if (tokens_per_second or segments_per_second) else None,
+            "wall_seconds": wall_seconds,
+        }
+
+    def lines(self):
+        """Human-readable plan."""
+        plan = self.report()
+        kinds = ", ".join(f"{kind} {count}" for kind, count in plan["by_kind"].items())
+        lines = [
+            f"Pending segments: {plan['pending_segments']}" + (f" ({kinds})" if kinds else ""),
+            f"Unique source strings: {plan['unique_sources']} ({plan['duplicates']} duplicates)"
+            + (f", {plan['unique_templates']} once names/numbers/tags are masked"
+               if plan["unique_templates"] is not None else ""),
+            f"Requests: {plan['requests']}" + (" (batched)" if self.batch_config.get("enabled", False) else ""),
+            f"Prompt tokens: ~{plan['prompt_tokens_full_dictionary']} with the full dictionary, "
+            f"~{plan['prompt_tokens_glossary']} with the glossary filter "
+            f"({'on' if plan['glossary_filter'] else 'off'})",
+            f"Completion tokens: ~{plan['completion_tokens']} (completion_ratio {self.completion_ratio})",
+        ]
+        if plan["wall_seconds"] is None:
+            lines.append("Projected wall time: unknown, set [plan] tokens_per_second or finish a run "
+                         "with a [metrics] report first")
+        elif plan["tokens_per_second"]:
+            lines.append(f"Projected wall time: {format_duration(plan['wall_seconds'])} at "
+                         f"{plan['tokens_per_second']:.1f} completion tokens/s ({plan['throughput_source']})")
+        else:
+            lines.append(f"Projected wall time: {format_duration(plan['wall_seconds'])} at "
+                         f"{plan['segments_per_second']:.1f} segments/s ({plan['throughput_source']})")
+        return lines
@@ -0,0 +1,39 @@
+"""
+Apply many string replacements in a single scan.
+"""
+import re
+
+
+class Replacer:
+    """
+    Compiled form of an {old: new} mapping.
+
+    All keys go into one alternation regex, longest first, so overlapping
+    keys such as "Marchant" and "Aston Marchant" always resolve to the
+    longest match and the result doesn't depend on dict order. With
+    word_boundaries, a key only matches when it isn't part of a longer word.
+    """
+
+    def __init__(self, mappings, word_boundaries=False):
+        self.mappings = dict(mappings)
+        self.word_boundaries = word_boundaries
+        keys = sorted((key for key in self.mappings if key), key=len, reverse=True)
+        if not keys:
+            self.pattern = None
+            return
+        alternation = "|".join(re.escape(key) for key in keys)
+        if word_boundaries:
+            alternation = rf"(?<!\w)(?:{alternation})(?!\w)"
+        self.pattern = re.compile(alternation)
+
+    def _replacement(self, match):
+        return self.mappings[match.group(0)]
+
+    def subn(self, text):
+        """Return (text with every mapping applied, number of replacements)."""
+        if self.pattern is None or not isinstance(text, str):
+            return text, 0
+        return self.pattern.subn(self._replacement, text)
+
+    def sub(self, text):
+        return self.subn(text)[0]
@@ -0,0 +1,82 @@
+"""
+Length-bucketed scheduling.
+
+Story files interleave short names and choices with long lines, so sending
+jobs in file order makes the server switch between tiny and large requests
+all the time, and a short line batched with a long one waits for the long
+one to finish. Jobs are sorted by source length into short, medium and long
+buckets instead. Short ones are packed densely, long ones go out alone, and
+each bucket has its own token budget floor. Long jobs are queued first so
+they don't end up as the stragglers of a file. Story results still go into
+their own slots, and new character dict entries are put back in source order
+before the dict is written, so the output files don't depend on the order
+requests were sent or finished in.
+"""
+from honsetrans.batching import make_batches
+
+
+class Bucket:
+    """Jobs whose source is at most max_chars long, and how to send them."""
+
+    def __init__(self, name, max_chars, batch_segments, batch_chars, budget_floor):
+        self.name = name
+        self.max_chars = max_chars
+        self.batch_segments = batch_segments
+        self.batch_chars = batch_chars
+        self.budget_floor = budget_floor
+
+
+class LengthBuckets:
+    """The short/medium/long buckets configured in [scheduling]."""
+
+    def __init__(self, scheduling_config=None):
+        scheduling_config = scheduling_config or {}
+        short_chars = scheduling_config.get("short_chars", 16)
+        long_chars = scheduling_config.get("long_chars", 80)
+        self.buckets = [
+            Bucket("short", short_chars,
+                   scheduling_config.get("short_batch_segments", 16),
+                   scheduling_config.get("short_batch_chars", 256),
+                   scheduling_config.get("short_budget_floor", 32)),
+            Bucket("medium", long_chars,
+                   scheduling_config.get("medium_batch_segments", 6),
+                   scheduling_config.get("medium_batch_chars", 400),
+                   scheduling_config.get("medium_budget_floor", 64)),
+            # Long lines always go out on their own
+            Bucket("long", None, 1, None,
+                   scheduling_config.get("long_budget_floor", 128)),
+        ]
+
+    def bucket_for(self, text):
+        for bucket in self.buckets:
+            if bucket.max_chars is None or len(text) <= bucket.max_chars:
+                return bucket
+
+    def groups(self, jobs, batched):
+        """Request groups for jobs: long jobs first, then medium, then short, each bucket packed to its own limits."""
+        by_bucket = {bucket.name: [] for bucket in self.buckets}
+        for job in jobs:
+            by_bucket[self.bucket_for(job.source).name].append(job)
+
+        groups = []
+        for bucket in reversed(self.buckets):
+            bucket_jobs = by_bucket[bucket.name]
+            if batched and bucket.batch_segments > 1:
+                groups.extend(make_batches(bucket_jobs, bucket.batch_segments, bucket.batch_chars))
+            else:
+                groups.extend([job] for job in bucket_jobs)
+        return groups
+
+
+def make_groups(jobs, batch_config=None, buckets=None):
+    """
+    Split jobs into request groups: by length bucket if buckets is given,
+    otherwise in order, batched with the [batch] limits if batching is on.
+    """
+    batch_config = batch_config or {}
+    batched = batch_config.get("enabled", False)
+    if buckets is not None:
+        return buckets.groups(jobs, batched)
+    if batched:
+        return make_batches(jobs, batch_config.get("max_segments", 8), batch_config.get("max_chars", 400))
+    return [[job] for job in jobs]
@@ -0,0 +1,74 @@
+"""
+Walk the translatable slots of a story/home JSON file in a single pass.
+"""
+
+
+class Segment:
+    """
+    One translatable slot: the Japanese source field and the English field
+    its translation goes into, on the dict that holds both.
+    """
+
+    def __init__(self, key, kind, container, source_field, target_field):
+        self.key = key
+        self.kind = kind
+        self.container = container
+        self.source_field = source_field
+        self.target_field = target_field
+
+    @property
+    def source(self):
+        return self.container.get(self.source_field, "")
+
+    @property
+    def value(self):
+        return self.container.get(self.target_field, "")
+
+    @property
+    def pending(self):
+        """True if the slot has no translation yet."""
+        value = self.value
+        return not (isinstance(value, str) and value.strip())
+
+    @property
+    def translatable(self):
+        """
+        False for slots with nothing to translate: narration has no speaker,
+        some files have no title and some blocks have an empty jpText.
+        """
+        source = self.source
+        return isinstance(source, str) and bool(source.strip())
+
+    def set(self, value):
+        self.container[self.target_field] = value
+
+
+def iter_story_segments(data):
+    """
+    Yield every translatable slot of a story file exactly once, in file order:
+    the title, then each block's name, text and choices.
+
+    Segment.kind is one of "title", "name", "text" or "choice".
+    """
+    if "title" in data or "enTitle" in data:
+        yield Segment("enTitle", "title", data, "title", "enTitle")
+
+    text = data.get("text")
+    if not isinstance(text, list):
+        return
+    for i, item in enumerate(text):
+        if not isinstance(item, dict):
+            continue
+        yield Segment(f"text/{i}/enName", "name", item, "jpName", "enName")
+        yield Segment(f"text/{i}/enText", "text", item, "jpText", "enText")
+        choices = item.get("choices")
+        if not isinstance(choices, list):
+            continue
+        for j, choice in enumerate(choices):
+            if isinstance(choice, dict):
+                yield Segment(f"text/{i}/choices/{j}/enText", "choice", choice, "jpText", "enText")
+
+
+def count_pending(data):
+    """Number of slots in a story file that still need translating."""
+    return sum(1 for segment in iter_story_segments(data) if segment.pending and segment.translatable)
@@ -0,0 +1,23 @@
+"""
+Rough token counts for prompt size reporting without loading a real tokenizer.
+"""
+
+
+def approx_tokens(text):
+    """
+    Estimate how many tokens text costs.
+
+    Kana, kanji and full-width punctuation are counted as one token each and
+    everything else as one token per four characters, which is close enough
+    for the Mistral/Llama style tokenizers we run.
+    """
+    if not text:
+        return 0
+    wide = sum(1 for ch in text if ord(ch) >= 0x3000)
+    narrow = len(text) - wide
+    return wide + (narrow + 3) // 4
+
+
+def token_budget(text, ratio, floor, ceiling):
+    """max_tokens for translating text: ratio times its size, at least floor but never over ceiling."""
+    return min(ceiling, max(floor, int(approx_tokens(text) * ratio)))
@@ -0,0 +1,382 @@
+"""
+Translate text through the OpenAI-compatible chat completions endpoint.
+"""
+import json
+import threading
+import time
+
+from honsetrans.batching import BATCH_INSTRUCTIONS, build_batch_payload, parse_batch_response
+from honsetrans.cache import TranslationMemory
+from honsetrans.client import ApiError
+from honsetrans.concurrency import AdaptiveLimiter
+from honsetrans.backends import Dispatcher
+from honsetrans.glossary import Glossary
+from honsetrans.masking import MASK_INSTRUCTIONS, Masker
+from honsetrans.metrics import RunMetrics
+from honsetrans.scheduling import LengthBuckets
+from honsetrans.tokens import approx_tokens, token_budget
+from honsetrans.validation import Validator
+
+SAMPLING_PARAMS = ("top_p", "top_k", "max_tokens", "repetition_penalty")
+
+DICTIONARY_INTRO = " Refer to below for a dictionary in json format with the order japanese_text : english_text. (example\"ミホノブルボン\": \"Mihono Bourbon\", which means translate ミホノブルボン to Mihono Bourbon. \n "
+
+
+def build_system_prompt(system_prompt, dictionary_json_str):
+    """The system message: fixed instructions first, then the (possibly filtered) dictionary."""
+    return f"{system_prompt}{DICTIONARY_INTRO}{dictionary_json_str} \n translate the below text"
+
+
+class Translator:
+    """Builds the translation request and sends it, checking the translation memory first."""
+
+    def __init__(self, config, dictionary):
+        self.config = config
+        self.server = config["server"]
+        self.dictionary_json_str = json.dumps(dictionary, ensure_ascii=False)
+        self.metrics = RunMetrics(config.get("metrics"))
+        concurrency_config = config.get("concurrency", {})
+        # Connection pools sized for the highest limit the controller may pick; a backend's
+        # share of a default maximum above 16 is at most its weight, which it is sized for anyway
+        pool_size = (concurrency_config.get("maximum", 0) or 16) if concurrency_config.get("adaptive", True) else 0
+        self.dispatcher = Dispatcher(dict(self.server, pool_size=pool_size), config.get("backends"), self.metrics)
+        self.limiter = AdaptiveLimiter(self.dispatcher.capacity, concurrency_config, self.metrics)
+        for backend in self.dispatcher.backends:
+            backend.client.on_overload = self.limiter.overloaded
+        # Worker pools get a thread per possible slot, the limiter decides how many are in use
+        self.max_concurrency = self.limiter.maximum
+        self.memory = self._open_memory(config.get("cache", {}))
+        self.glossary = Glossary(dictionary) if config.get("glossary", {}).get("filter", True) else None
+        masking_config = config.get("masking", {})
+        self.masker = Masker(dictionary, masking_config) if masking_config.get("enabled", True) else None
+        scheduling_config = config.get("scheduling", {})
+        self.buckets = LengthBuckets(scheduling_config) if scheduling_config.get("enabled", True) else None
+        validation_config = config.get("validation", {})
+        self.validator = Validator(validation_config) if validation_config.get("enabled", True) else None
+        self.masked_hits = 0
+        self.masked_requests = 0
+        self.mask_fallbacks = 0
+        self.requests_sent = 0
+        self.glossary_tokens_saved = 0
+        self.batch_fallbacks = 0
+        self.budget = config.get("budget", {})
+        self.budget_retries = 0
+        self.completion_ratios = []
+        self._stats_lock = threading.Lock()
+
+    def _open_memory(self, cache_config):
+        if not cache_config.get("enabled", True):
+            return None
+        models = sorted({backend.model for backend in self.dispatcher.backends})
+        context = {
+            "model": models[0] if len(models) == 1 else models,
+            "system_prompt": self.server["system_prompt"],
+            "temperature": self.server["temperature"],
+            "params": {param: self.server.get(param) for param in SAMPLING_PARAMS},
+            "dictionary": self.dictionary_json_str,
+        }
+        return TranslationMemory(
+            cache_config.get("path", "translation_memory.sqlite3"),
+            context,
+            cache_config.get("max_entries", 200000),
+        )
+
+    def system_prompt(self, rawText):
+        """
+        Build the system message for rawText.
+
+        Only the dictionary entries that occur in rawText are included, and
+        they come after the fixed instructions so the start of the prompt is
+        byte-identical across requests and the server can reuse its cache.
+        """
+        if self.glossary is None:
+            dictionary_json_str = self.dictionary_json_str
+        else:
+            dictionary_json_str = json.dumps(self.glossary.entries(rawText), ensure_ascii=False)
+            with self._stats_lock:
+                self.glossary_tokens_saved += (approx_tokens(self.dictionary_json_str)
+                                               - approx_tokens(dictionary_json_str))
+        return build_system_prompt(self.server["system_prompt"], dictionary_json_str)
+
+    def _send(self, post_request, max_chars):
+        """dispatcher.chat inside one of the limiter's slots, reporting latency and tokens back to it."""
+        self.limiter.acquire()
+        start = time.perf_counter()
+        try:
+            body = self.dispatcher.chat(post_request, max_chars)
+        except BaseException:
+            self.limiter.release()
+            raise
+        usage = body.get("usage") or {}
+        tokens = usage.get("completion_tokens") or approx_tokens(body["choices"][0]["message"]["content"])
+        self.limiter.release(time.perf_counter() - start, tokens)
+        return body
+
+    def _request(self, system_content, user_content, overrides=None, bucket_text=None):
+        """The reply's content, or None if a stream ran past its runaway limit and was cut off."""
+        post_request = {
+            "model": self.server["model"],
+            "temperature": self.server["temperature"],
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system_content,
+                },
+                {
+                    "role": "user", "content": user_content
+                }
+            ],
+        }
+
+        for param in SAMPLING_PARAMS:
+            value = self.server[param]
+            if value is not None:
+                post_request[param] = value
+        if self.server.get("stop"):
+            post_request["stop"] = self.server["stop"]
+        if overrides:
+            post_request.update(overrides)
+
+        max_chars = None
+        if self.server.get("stream", False):
+            post_request["stream"] = True
+            # Ask for the usage block at the end of the stream as well
+            post_request["stream_options"] = {"include_usage": True}
+            max_chars = max(self.server.get("runaway_min_chars", 200),
+                            int(len(user_content) * self.server.get("runaway_ratio", 8.0)))
+
+        budget = None
+        if self.budget.get("enabled", True):
+            ceiling = self.budget.get("ceiling", self.server["max_tokens"])
+            floor = self.budget.get("floor", 64)
+            if self.buckets is not None:
+                # Each length bucket can raise the floor, a batch goes by its longest segment
+                floor = max(floor, self.buckets.bucket_for(bucket_text or user_content).budget_floor)
+            budget = token_budget(user_content, self.budget.get("ratio", 3.0), floor, ceiling)
+            post_request["max_tokens"] = budget
+
+        json_traslated = self._send(post_request, max_chars)
+        with self._stats_lock:
+            self.requests_sent += 1
+
+        if budget is not None and json_traslated["choices"][0].get("finish_reason") == "length" and budget < ceiling:
+            # Cut off by its budget: give it one more go with room to finish
+            post_request["max_tokens"] = min(ceiling, budget * self.budget.get("retry_factor", 4))
+            json_traslated = self._send(post_request, max_chars)
+            with self._stats_lock:
+                self.requests_sent += 1
+                self.budget_retries += 1
+
+        usage = json_traslated.get("usage") or {}
+        if usage.get("completion_tokens"):
+            with self._stats_lock:
+                self.completion_ratios.append(usage["completion_tokens"] / max(approx_tokens(user_content), 1))
+        if json_traslated["choices"][0].get("finish_reason") == "runaway":
+            return None
+        return json_traslated["choices"][0]["message"]["content"]
+
+    def _log(self, line):
+        # Per-segment output only in verbose mode, the progress line covers it otherwise
+        if self.metrics.verbose:
+            print(line)
+
+    def _check(self, rawText, trans_text, record=True):
+        """The validation rules trans_text breaks as a translation of rawText; record=False keeps them out of the metrics."""
+        if trans_text is None:
+            # A runaway reply cut off by _request, whatever is left of it is junk
+            failed = ["length"]
+        elif self.validator is None:
+            return []
+        else:
+            failed = self.validator.failures(rawText, trans_text)
+        if failed and record:
+            self.metrics.record_validation(failed)
+        return failed
+
+    def _retry_invalid(self, rawText, trans_text, failed):
+        """
+        Send rawText again on its own, unmasked, with hints and params for
+        the rules it failed. Returns (translation, rules the last reply still breaks).
+        """
+        for _ in range(self.validator.retries):
+            self._log(f"Validation failed ({', '.join(failed)}), retrying: {trans_text!r}")
+            hints, params = self.validator.retry_params(failed)
+            self.metrics.record_validation_retry()
+            trans_text = self._request(self.system_prompt(rawText) + hints, rawText, params)
+            failed = self._check(rawText, trans_text)
+            if not failed:
+                break
+        return trans_text, failed
+
+    def _lookup(self, rawText, masked=None):
+        """
+        rawText's translation from the memory, straight or through masked's
+        template, or None. Counts as one hit or miss however many keys it tried.
+        """
+        if self.memory is None:
+            return None
+        cached = self._cached(rawText)
+        if cached is None and masked is not None and masked.masked:
+            cached = self._cached_template(rawText, masked)
+        self.memory.record_lookup(cached is not None)
+        return cached
+
+    def _cached(self, rawText):
+        """rawText's translation from the memory, or None if there is none or it fails validation."""
+        cached = self.memory.get(rawText, count=False)
+        if cached is None:
+            return None
+        # Entries stored before validation existed may not pass it; those are
+        # dropped so the line is translated (and checked) again
+        if self._check(rawText, cached, record=False):
+            self.memory.delete(rawText)
+            return None
+        return cached
+
+    def _cached_template(self, rawText, masked):
+        """The cached translation of masked's template, filled in, or None."""
+        cached = self.memory.get(masked.template, count=False)
+        if cached is None:
+            return None
+        filled = masked.fill(cached)
+        if filled is None or self._check(rawText, filled, record=False):
+            self.memory.delete(masked.template)
+            return None
+        with self._stats_lock:
+            self.masked_hits += 1
+        return filled
+
+    def _translate_masked(self, rawText, masked):
+        """
+        Translate rawText as masked, a template with its names, numbers and
+        tags masked. Returns None if there is nothing to mask or the reply's
+        placeholders don't match or it fails validation, in which case
+        rawText goes out as it is.
+        """
+        if not masked.masked:
+            return None
+        template_text = self._request(self.system_prompt(masked.template) + MASK_INSTRUCTIONS, masked.template)
+        if template_text is None:
+            self._log("Template reply ran away, sending the line unmasked")
+            return None
+        filled = masked.fill(template_text)
+        with self._stats_lock:
+            self.masked_requests += 1
+            if filled is None:
+                self.mask_fallbacks += 1
+        if filled is None:
+            self._log(f"Placeholders lost in {template_text!r}, sending the line unmasked")
+            return None
+        failed = self._check(rawText, filled)
+        if failed:
+            self._log(f"Validation failed ({', '.join(failed)}) for {filled!r}, sending the line unmasked")
+            return None
+        self._log(f"Translation (template): {filled}")
+        self.metrics.record_segment()
+        if self.memory is not None:
+            self.memory.put(masked.template, template_text)
+        return filled
+
+    def translate(self, rawText, lookup=True):
+        """Translate rawText; lookup=False skips the memory, for segments a batch already looked up."""
+        masked = self.masker.mask(rawText) if self.masker is not None else None
+        cached = self._lookup(rawText, masked) if lookup else None
+        if cached is not None:
+            self._log(f"Translation (cached): {cached}")
+            self.metrics.record_segment(cached=True)
+            return cached
+
+        if masked is not None:
+            filled = self._translate_masked(rawText, masked)
+            if filled is not None:
+                return filled
+
+        trans_text = self._request(self.system_prompt(rawText), rawText)
+        failed = self._check(rawText, trans_text)
+        if failed and self.validator is not None:
+            trans_text, failed = self._retry_invalid(rawText, trans_text, failed)
+        if trans_text is None:
+            # Nothing usable to write; the segment stays pending for the next run
+            self.metrics.record_unresolved()
+            raise ApiError(f"Every reply for {rawText!r} ran away and was cut off")
+        self._log(f"Translation: {trans_text}")
+        self.metrics.record_segment()
+
+        if failed:
+            # Written anyway so the file isn't held up, but not remembered, so the next run tries again
+            print(f"Translation still fails validation ({', '.join(failed)}): {trans_text!r}")
+            self.metrics.record_unresolved()
+        elif self.memory is not None:
+            self.memory.put(rawText, trans_text)
+        return trans_text
+
+    def translate_batch(self, texts):
+        """
+        Translate several texts with a single request.
+
+        Returns one entry per text; entries the reply didn't cover or that
+        fail validation are None and should be retried with translate().
+        """
+        results = [None] * len(texts)
+        pending = []
+        for index, text in enumerate(texts):
+            # Batches go out unmasked, but a cached template still saves the segment a slot
+            masked = self.masker.mask(text) if self.masker is not None and self.memory is not None else None
+            cached = self._lookup(text, masked)
+            if cached is not None:
+                self._log(f"Translation (cached): {cached}")
+                self.metrics.record_segment(cached=True)
+                results[index] = cached
+            else:
+                pending.append(index)
+        if not pending:
+            return results
+
+        pending_texts = [texts[index] for index in pending]
+        system_content = self.system_prompt("\n".join(pending_texts)) + BATCH_INSTRUCTIONS
+        content = self._request(system_content, build_batch_payload(pending_texts),
+                                bucket_text=max(pending_texts, key=len))
+        if content is None:
+            # A runaway reply: every segment goes out again on its own
+            translated = [None] * len(pending_texts)
+        else:
+            translated = parse_batch_response(content, len(pending_texts))
+        with self._stats_lock:
+            self.batch_fallbacks += translated.count(None)
+
+        for index, trans_text in zip(pending, translated):
+            if trans_text is None:
+                continue
+            failed = self._check(texts[index], trans_text)
+            if failed:
+                continue
+            self._log(f"Translation: {trans_text}")
+            self.metrics.record_segment()
+            results[index] = trans_text
+            if self.memory is not None:
+                self.memory.put(texts[index], trans_text)
+        return results
+
+    def summary(self):
+        """Lines describing this run's requests, cache and prompt savings, printed at the end of a run."""
+        lines = self.dispatcher.summary()
+        lines.extend(self.metrics.summary())
+        if self.memory is not None:
+            lines.append(self.memory.summary())
+        if self.glossary is not None and self.requests_sent:
+            lines.append(f"Glossary: {self.glossary_tokens_saved / self.requests_sent:.0f} prompt tokens "
+                         f"saved per request on average ({self.requests_sent} requests)")
+        if self.budget.get("enabled", True) and self.requests_sent:
+            line = f"Token budget: {self.budget_retries} requests hit their max_tokens budget and were retried"
+            if self.completion_ratios:
+                ratios = sorted(self.completion_ratios)
+                line += (f", completion/source token ratio median {ratios[len(ratios) // 2]:.1f}"
+                         f" / p95 {ratios[min(len(ratios) - 1, int(len(ratios) * 0.95))]:.1f}")
+            lines.append(line)
+        if self.masker is not None and (self.masked_hits or self.masked_requests):
+            lines.append(f"Masking: {self.masked_hits} lines filled in from a cached template, "
+                         f"{self.masked_requests} templates translated, "
+                         f"{self.mask_fallbacks} replies lost placeholders and were sent again unmasked")
+        if self.batch_fallbacks:
+            lines.append(f"Batching: {self.batch_fallbacks} segments missing from batch replies were sent again on their own")
+        return lines
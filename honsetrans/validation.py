@@ -0,0 +1,72 @@
+"""
+Check each translation as it comes back, before it is written.
+
+A Validator runs a few precompiled rules on every reply:
+
+    markers       "###"/"### Response:", <unk> or chat template tokens left in the reply
+    japanese      too large a share of kana/kanji, i.e. not really translated
+    placeholders  <tag>/%placeholder tokens of the source missing or invented
+    length        runaway output, far longer than the source
+    empty         an empty reply for a non-empty source
+
+A segment that fails is sent again on its own with a hint for the rules it
+broke and adjusted sampling params; everything else is written right away.
+"""
+import re
+
+from honsetrans.masking import TAG_PATTERN
+
+RULES = ("markers", "japanese", "placeholders", "length", "empty")
+
+MARKER = re.compile(r"###|<\|[A-Za-z_]+\|>|<(?:s|/s|unk)>")
+JAPANESE = re.compile(r"[぀-ヿ㐀-䶿一-鿿ｦ-ﾟ]")
+TAG = re.compile(TAG_PATTERN)
+NON_SPACE = re.compile(r"\S")
+
+RULE_HINTS = {
+    "markers": " Reply with the translation only.",
+    "japanese": " Translate all of the text into English.",
+    "placeholders": " Keep every <tag> and %placeholder exactly as written.",
+    "length": " Reply with the translation only.",
+    "empty": "",
+}
+
+
+class Validator:
+    """Precompiled checks for translated text."""
+
+    def __init__(self, validation_config=None):
+        validation_config = validation_config or {}
+        self.max_japanese_ratio = validation_config.get("max_japanese_ratio", 0.2)
+        self.max_length_ratio = validation_config.get("max_length_ratio", 8.0)
+        self.min_length_chars = validation_config.get("min_length_chars", 200)
+        self.retries = validation_config.get("retries", 2)
+        self.retry_temperature = validation_config.get("retry_temperature", 0.4)
+        self.retry_repetition_penalty = validation_config.get("retry_repetition_penalty", 1.2)
+
+    def failures(self, source, translation):
+        """The names of the rules translation breaks, in RULES order; empty if it's fine."""
+        failed = []
+        if MARKER.search(translation):
+            failed.append("markers")
+        characters = len(NON_SPACE.findall(translation))
+        if characters and len(JAPANESE.findall(translation)) / characters > self.max_japanese_ratio:
+            failed.append("japanese")
+        if set(TAG.findall(source)) != set(TAG.findall(translation)):
+            failed.append("placeholders")
+        if len(translation) > max(self.min_length_chars, len(source) * self.max_length_ratio):
+            failed.append("length")
+        if not characters and source.strip():
+            failed.append("empty")
+        return failed
+
+    def retry_params(self, failed):
+        """(text to add to the system prompt, request params to override) for another go after failed."""
+        hints = []
+        for rule in failed:
+            if RULE_HINTS[rule] not in hints:
+                hints.append(RULE_HINTS[rule])
+        params = {"temperature": self.retry_temperature}
+        if "markers" in failed or "length" in failed:
+            params["repetition_penalty"] = self.retry_repetition_penalty
+        return "".join(hints), params
@@ -1,111 +1,164 @@
-import json
-import requests
+import argparse
+import re
 import toml
 import os
 import time
 
-target_folder = "raw"
+from honsetrans import jsonio
+from honsetrans.checkpoint import Checkpoint, atomic_write_json
+from honsetrans.client import ApiError
+from honsetrans.dedup import normalize_source
+from honsetrans.dictindex import DictionaryIndex
+from honsetrans.engine import Job, run_jobs
+from honsetrans.manifest import Manifest
+from honsetrans.metrics import file_scope
+from honsetrans.pipeline import FilePipeline
+from honsetrans.planner import Planner
+from honsetrans.segments import count_pending, iter_story_segments
+from honsetrans.translator import Translator
+from postclean.fix_name_translations import create_fix_mappings
 
-with open("dictionary.json", "r", encoding="utf-8") as file:
-    dictionary = json.load(file)
-    dictionary_json_str = json.dumps(dictionary, ensure_ascii = False)
+target_folder = "raw"
 
 with open("config.toml", "r") as f:
     config = toml.load(f)
 
+jsonio.configure(config)
+dictionary = jsonio.load("dictionary.json")
+
+translator = Translator(config, dictionary)
+
+# Known mistranslated speaker names are fixed as they're written, the way
+# postclean/fix_name_translations.py fixes whole enName values
+NAME_FIXES = create_fix_mappings() if config.get("validation", {}).get("fixes", True) else {}
+
+def clean_title(text):
+    return text.replace("\n### Response:\n", "")
+
+def clean_name(text):
+    text = text.replace("\n### Response:\n", "")
+    return NAME_FIXES.get(text, text)
+
+def clean_text(text):
+    return text.replace('\n', ' ').replace('  ', ' ').replace("\n### Response:\n", "")
+
+def clean_choice(text):
+    return text.replace('\n', ' ').replace('  ', ' ')
+
+CLEANERS = {
+    "title": clean_title,
+    "name": clean_name,
+    "text": clean_text,
+    "choice": clean_choice,
+}
+
+def collect_jobs(raw_load):
+    """Return a job for every segment of a story file that still needs translating."""
+    jobs = []
+    skipped = 0
+    for segment in iter_story_segments(raw_load):
+        if not segment.pending:
+            skipped += 1
+        elif segment.translatable:
+            if translator.metrics.verbose:
+                print(f"{segment.kind.capitalize()}: ", segment.source)
+            jobs.append(Job(segment.key, segment.source, segment.container, segment.target_field,
+                            CLEANERS[segment.kind]))
+    if skipped:
+        print(f"Skipped {skipped} segments that are already translated")
+    return jobs
+
+def story_file_paths():
+    """Every JSON file under target_folder."""
+    return [os.path.join(root, file_name)
+            for root, _, files in os.walk(target_folder) for file_name in files if file_name.endswith('.json')]
+
+def forget_dedup_results(changed):
+    """Drop results of an interrupted dedup run whose source uses one of the changed dictionary keys."""
+    results_path = config.get("dedup", {}).get("results", "translation_dedup.json")
+    terms = changed | {normalize_source(key) for key in changed}
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True) if term))
+    results = jsonio.load(results_path) if os.path.exists(results_path) else {}
+    dropped = Checkpoint(results_path, results, config.get("checkpoint")).forget(pattern.search)
+    stale = [key for key in results if pattern.search(key)]
+    for key in stale:
+        del results[key]
+    if stale:
+        atomic_write_json(results_path, results)
+    return dropped + len(stale)
+
+def invalidate_dictionary_changes():
+    """
+    Clear the translation of every segment whose source uses a
+    dictionary.json entry that was added, removed or changed since the last
+    run, so only those segments are translated again.
+    """
+    invalidation_config = config.get("invalidation", {})
+    if not invalidation_config.get("enabled", True):
+        return
+    index = DictionaryIndex(invalidation_config.get("index", "dictionary_index.sqlite3"), dictionary)
+    try:
+        changed = index.changed_keys("story")
+        if changed:
+            print(f"{len(changed)} dictionary entries changed since the last run")
+            file_paths = story_file_paths()
+            stale_paths = [file_path for file_path in file_paths if not index.is_fresh(file_path)]
+            if stale_paths:
+                print(f"Indexing dictionary terms in {len(stale_paths)} files")
+            for file_path in stale_paths:
+                segments = iter_story_segments(jsonio.load(file_path))
+                index.update_file(file_path, ((segment.key, segment.source) for segment in segments
+                                              if segment.translatable and isinstance(segment.source, str)))
+
+            cleared = 0
+            affected = index.affected(changed, set(file_paths))
+            for file_path, keys in affected.items():
+                raw_load = jsonio.load(file_path)
+                # A journal from an interrupted run mustn't put the old translations back
+                Checkpoint(file_path, raw_load, config.get("checkpoint")).forget(keys.__contains__)
+                count = 0
+                for segment in iter_story_segments(raw_load):
+                    if segment.key in keys and not segment.pending:
+                        segment.set("")
+                        count += 1
+                if count:
+                    atomic_write_json(file_path, raw_load)
+                    index.mark_fresh(file_path)
+                    cleared += count
+            cleared_results = forget_dedup_results(changed)
+            print(f"Cleared {cleared} translations in {len(affected)} files that use them"
+                  + (f" and {cleared_results} unfinished dedup results" if cleared_results else ""))
+        index.save_snapshot("story")
+    finally:
+        index.close()
+
 def process_json(file_path):
+    """Translate every pending segment of file_path and return how many are still pending."""
     print(f"Loading {file_path}")
     file_start_time = time.time()
-    count = -1
-    with open(file_path, "r", encoding="utf-8") as file:
-        raw_load = json.load(file)
-
-    while True:
-        count = count + 1
-        try:
-            if raw_load["text"][count].get("enName", "").strip():
-                print(f"Name (SKIP): '{raw_load['text'][count]['jpName']}' already done.")
-            else:    
-                print("Name: ",raw_load["text"][count]["jpName"])
-                if not raw_load["text"][count].get("jpName", "").strip():
-                    print("no name")
-                else:
-                    enName = translate(raw_load["text"][count]["jpName"])
-                    enName = enName.replace("\n### Response:\n", "")
-                        
-                    raw_load["text"][count]["enName"] = enName
-           
-            
-            if raw_load["text"][count].get("enText", "").strip():
-                print(f"Text (SKIP): '{raw_load['text'][count]['jpText']}' already done.")
-            else:    
-                print("Text: ",raw_load["text"][count]["jpText"])
-                enText = translate(raw_load["text"][count]["jpText"])
-                enText = enText.replace('\n', ' ').replace('  ', ' ').replace("\n### Response:\n", "")    
-                raw_load["text"][count]["enText"] = enText
-        except IndexError: 
-            print("Finished!")
-            break
-
-        for i, entry in enumerate(raw_load["text"]):
-            if "choices" in entry:
-                for j, choice in enumerate(entry["choices"]):
-                    if choice.get("enText", "").strip():
-                        print(f"Choice (SKIP): already done.")
-                    else:
-                        print("Choice: ", choice["jpText"])
-                        enText = translate(choice["jpText"])
-                        enText = enText.replace('\n', ' ').replace('  ', ' ')
-                        raw_load["text"][i]["choices"][j]["enText"] = enText                                                                           
-
-    with open(file_path, "w", encoding="utf-8") as file:
-        json.dump(raw_load, file, indent=4, ensure_ascii=False) 
+    raw_load = jsonio.load(file_path)
+
+    jobs = collect_jobs(raw_load)
+    if not jobs:
+        print(f"Nothing to translate in {file_path}")
+        return 0
+
+    checkpoint = Checkpoint(file_path, raw_load, config.get("checkpoint"))
+    jobs = checkpoint.replay(jobs)
+    with file_scope(file_path):
+        run_jobs(jobs, translator, translator.max_concurrency, config.get("batch"), checkpoint.record)
+    print("Finished!")
+
+    checkpoint.save()
 
     file_end_time = time.time()
     file_duration = file_end_time - file_start_time
     print(f"Wrote translated data to {file_path}")
     print(f"File translation time: {file_duration:.2f} seconds.")
-
-def translate(rawText):
-    api_key = config["server"]["api_key"]
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-
-    post_request = {
-        "model" : config["server"]["model"],
-        "temperature" : config["server"]["temperature"],
-        "messages" : [
-            {
-                "role" : "system", "content" : f"{config['server']['system_prompt']} Refer to below for a dictionary in json format with the order japanese_text : english_text. (example\"ミホノブルボン\": \"Mihono Bourbon\", which means translate ミホノブルボン to Mihono Bourbon. \n {dictionary_json_str} \n translate the below text",
-            },
-            {
-                "role": "user", "content": rawText
-            }
-        ],
-    }
-
-    optional_params = {
-        "top_p": config["server"]["top_p"],
-        "top_k": config["server"]["top_k"],
-        "max_tokens": config["server"]["max_tokens"],
-        "repetition_penalty": config["server"]["repetition_penalty"]
-    }
-
-    for param, value in optional_params.items():
-        if value is not None:
-            post_request[param] = value
-
-    response = requests.post(
-        config["server"]["api_url"],
-        headers = headers,
-        json = post_request
-    )
-    json_traslated = response.json()
-    trans_text = json_traslated["choices"][0]["message"]["content"]
-    print(f"Translation: {trans_text}")
-    return trans_text
+    file_summary = translator.metrics.file_summary(file_path)
+    if file_summary:
+        print(file_summary)
+    return count_pending(raw_load)
 
 def transLoop():
     if not os.path.exists(target_folder):
@@ -113,15 +166,103 @@ def transLoop():
         return
     print(f"Running through all files in {target_folder}")
     batch_start_time = time.time()
+    invalidate_dictionary_changes()
     file_count = 0
+    complete_count = 0
+    manifest = Manifest(config.get("manifest", {}).get("path", "translation_manifest.json"))
+    file_paths = []
+    known_pending = {}
     for root, _, files in os.walk(target_folder):
             for file_name in files:
                 if file_name.endswith('.json'):
                     file_path = os.path.join(root, file_name)
-                    process_json(file_path)
-                    file_count += 1    
+                    pending = manifest.known_pending(file_path)
+                    if pending == 0:
+                        complete_count += 1
+                        continue
+                    if pending is not None:
+                        known_pending[file_path] = pending
+                    file_paths.append(file_path)
+
+    dedup_config = config.get("dedup", {})
+    pipeline_config = config.get("pipeline", {})
+    try:
+        if dedup_config.get("enabled", True) or pipeline_config.get("enabled", True):
+            if not pipeline_config.get("enabled", True):
+                # Dedup shares results through the pipeline, so it runs it one file at a time
+                pipeline_config = dict(pipeline_config, prefetch=1, order="walk")
+            dedup = None
+            if dedup_config.get("enabled", True):
+                # Finished strings are kept in results_path until every file has them
+                results_path = dedup_config.get("results", "translation_dedup.json")
+                results = jsonio.load(results_path) if os.path.exists(results_path) else {}
+                dedup = Checkpoint(results_path, results, config.get("checkpoint"))
+                dedup.restore()
+            pipeline = FilePipeline(translator, collect_jobs, manifest.update, pipeline_config,
+                                    config.get("batch"), config.get("checkpoint"), dedup)
+            file_paths = pipeline.schedule(file_paths, known_pending)
+            pipeline.run(file_paths)
+            file_count = len(file_paths) - len(pipeline.failed_files)
+            if dedup is not None:
+                # Every file has been written; lines that failed stay pending in their files
+                dedup.save()
+                os.remove(results_path)
+        else:
+            for file_path in file_paths:
+                try:
+                    pending = process_json(file_path)
+                except ApiError as error:
+                    # Progress so far is in the file's journal, carry on with the next file
+                    print(f"Failed to translate {file_path}: {error}")
+                    continue
+                manifest.update(file_path, pending)
+                file_count += 1
+    finally:
+        manifest.save()
+        report_path = translator.metrics.write_report()
+        if report_path:
+            print(f"Run report saved to {report_path}")
     batch_end_time = time.time()
     batch_duration = batch_end_time - batch_start_time
     print(f"Files processed: {file_count}")
+    print(f"Files already complete: {complete_count}")
     print(f"Total batch time: {batch_duration:.2f} seconds.")
-transLoop()
\ No newline at end of file
+    for line in translator.summary():
+        print(line)
+
+def planLoop():
+    """Count and cost every pending segment in target_folder without sending anything."""
+    if not os.path.exists(target_folder):
+        print("Folder does not exist")
+        return
+    print(f"Planning {target_folder} (no requests are sent)")
+    planner = Planner(config, dictionary)
+    manifest = Manifest(config.get("manifest", {}).get("path", "translation_manifest.json"))
+    file_count = 0
+    complete_count = 0
+    for root, _, files in os.walk(target_folder):
+        for file_name in files:
+            if not file_name.endswith('.json'):
+                continue
+            file_path = os.path.join(root, file_name)
+            if manifest.known_pending(file_path) == 0:
+                complete_count += 1
+                continue
+            file_count += 1
+            for segment in iter_story_segments(jsonio.load(file_path)):
+                if segment.pending and segment.translatable:
+                    planner.add(segment.kind, segment.source)
+    print(f"Files to translate: {file_count}")
+    print(f"Files already complete: {complete_count}")
+    for line in planner.lines():
+        print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Translate every story file in the raw folder")
+    parser.add_argument("--plan", action="store_true",
+                        help="only count pending segments and estimate tokens and time, without sending requests")
+    args = parser.parse_args()
+    if args.plan:
+        planLoop()
+    else:
+        transLoop()
\ No newline at end of file
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Run every postclean rule over raw/story, raw/home and character_system_text_dict.json in one pass.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from postclean.engine import clean_chardict_file, clean_story_files, configure_json, find_story_files
+from postclean.fix_name_translations import create_fix_mappings as create_story_fix_mappings
+from postclean.fix_name_translations_chardict import create_fix_mappings as create_chardict_fix_mappings
+from postclean.rules import HashMarkerRule, NameFixRule
+
+
+def safe_print(text):
+    """Print text with encoding error handling for Windows console."""
+    try:
+        print(text)
+    except UnicodeEncodeError:
+        print(text.encode('ascii', errors='replace').decode('ascii'))
+
+
+def add_counts(totals, counts):
+    for rule_name, count in counts.items():
+        totals[rule_name] = totals.get(rule_name, 0) + count
+
+
+def main():
+    """Main function to clean story files and the character system dict with every rule."""
+    configure_json()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes for story files (default: one per CPU)')
+    parser.add_argument('--word-boundaries', action='store_true',
+                        help='only fix names inside character system text when they are whole words')
+    args = parser.parse_args()
+
+    totals = {}
+
+    json_files = find_story_files()
+    total_files = len(json_files)
+    modified_count = 0
+    if json_files:
+        safe_print(f"Found {total_files} JSON files in raw/story and raw/home folders.")
+        safe_print("Processing...")
+        story_rules = [HashMarkerRule(), NameFixRule(create_story_fix_mappings())]
+        for i, (json_file, counts) in enumerate(clean_story_files(json_files, story_rules, args.processes), 1):
+            if counts:
+                modified_count += 1
+                add_counts(totals, counts)
+                safe_print(f"[{i}/{total_files}] Modified: {str(json_file)}")
+            elif i % 100 == 0:  # Print progress every 100 files
+                safe_print(f"[{i}/{total_files}] Processing...")
+        safe_print(f"Files modified: {modified_count} of {total_files}")
+    else:
+        safe_print("No JSON files found in raw/story or raw/home, skipping story files")
+
+    chardict_path = Path('character_system_text_dict.json')
+    if chardict_path.exists():
+        safe_print("\nProcessing character_system_text_dict.json...")
+        chardict_rules = [HashMarkerRule(), NameFixRule(create_chardict_fix_mappings(), args.word_boundaries)]
+        counts = clean_chardict_file(chardict_path, chardict_rules)
+        add_counts(totals, counts)
+        safe_print("File was modified." if counts else "No changes needed.")
+    else:
+        safe_print("\ncharacter_system_text_dict.json not found, skipping")
+
+    safe_print("\nCompleted! Fixes by rule:")
+    for rule in ('hash_markers', 'name_fixes'):
+        safe_print(f"  {rule}: {totals.get(rule, 0)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,71 +2,17 @@
 """
 Clean "###" markers and everything after them from enText and enName fields in JSON files.
 """
-import json
-import os
+import sys
 from pathlib import Path
 
-
-def clean_hash_marker(text):
-    """Remove '###' and everything after it from a string."""
-    if not isinstance(text, str):
-        return text
-
-    if '###' in text:
-        # Split on ### and take only the part before it
-        cleaned = text.split('###')[0]
-        # Strip trailing whitespace
-        return cleaned.rstrip()
-    return text
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from postclean.engine import clean_story_file, clean_story_files, configure_json, find_story_files
+from postclean.rules import HashMarkerRule
 
 
 def process_json_file(file_path):
-    """Process a single JSON file to remove ### markers from enText and enName."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        modified = False
-
-        # Process enTitle if it exists
-        if 'enTitle' in data and '###' in str(data.get('enTitle', '')):
-            data['enTitle'] = clean_hash_marker(data['enTitle'])
-            modified = True
-
-        # Process text array if it exists
-        if 'text' in data and isinstance(data['text'], list):
-            for item in data['text']:
-                if isinstance(item, dict):
-                    # Clean enName
-                    if 'enName' in item and '###' in str(item.get('enName', '')):
-                        item['enName'] = clean_hash_marker(item['enName'])
-                        modified = True
-
-                    # Clean enText
-                    if 'enText' in item and '###' in str(item.get('enText', '')):
-                        item['enText'] = clean_hash_marker(item['enText'])
-                        modified = True
-
-                    # Clean choices array if it exists
-                    if 'choices' in item and isinstance(item['choices'], list):
-                        for choice in item['choices']:
-                            if isinstance(choice, dict):
-                                # Clean enText in choices
-                                if 'enText' in choice and '###' in str(choice.get('enText', '')):
-                                    choice['enText'] = clean_hash_marker(choice['enText'])
-                                    modified = True
-
-        # Save the file if modifications were made
-        if modified:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            return True
-
-        return False
-
-    except Exception as e:
-        print(f"Error processing {file_path}: {e}")
-        return False
+    """Process a single JSON file to remove ### markers from enTitle, enName and enText."""
+    return bool(clean_story_file(file_path, [HashMarkerRule()]))
 
 
 def safe_print(text):
@@ -80,6 +26,7 @@ def safe_print(text):
 
 def main():
     """Main function to process all JSON files in the raw/story and raw/home folders."""
+    configure_json()
     raw_story_dir = Path('raw/story')
     raw_home_dir = Path('raw/home')
 
@@ -89,11 +36,7 @@ def main():
         return
 
     # Find all JSON files recursively from both directories
-    json_files = []
-    if raw_story_dir.exists():
-        json_files.extend(list(raw_story_dir.rglob('*.json')))
-    if raw_home_dir.exists():
-        json_files.extend(list(raw_home_dir.rglob('*.json')))
+    json_files = find_story_files()
 
     total_files = len(json_files)
     modified_count = 0
@@ -101,8 +44,8 @@ def main():
     safe_print(f"Found {total_files} JSON files in raw/story and raw/home folders.")
     safe_print("Processing...")
 
-    for i, json_file in enumerate(json_files, 1):
-        if process_json_file(json_file):
+    for i, (json_file, counts) in enumerate(clean_story_files(json_files, [HashMarkerRule()]), 1):
+        if counts:
             modified_count += 1
             safe_print(f"[{i}/{total_files}] Modified: {str(json_file)}")
         else:
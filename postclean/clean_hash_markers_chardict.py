@@ -2,54 +2,20 @@
 """
 Clean "###" markers and everything after them from character_system_text_dict.json.
 """
-import json
+import sys
 from pathlib import Path
 
-
-def clean_hash_marker(text):
-    """Remove '###' and everything after it from a string."""
-    if not isinstance(text, str):
-        return text
-
-    if '###' in text:
-        # Split on ### and take only the part before it
-        cleaned = text.split('###')[0]
-        # Strip trailing whitespace
-        return cleaned.rstrip()
-    return text
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from postclean.engine import clean_chardict_file, configure_json
+from postclean.rules import HashMarkerRule
 
 
 def process_character_dict(file_path):
     """Process character_system_text_dict.json to remove ### markers."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        modified = False
-
-        # Iterate through character IDs
-        for char_id, text_dict in data.items():
-            if isinstance(text_dict, dict):
-                # Iterate through text IDs and their values
-                for text_id, text_value in text_dict.items():
-                    if isinstance(text_value, str) and '###' in text_value:
-                        cleaned = clean_hash_marker(text_value)
-                        if cleaned != text_value:
-                            text_dict[text_id] = cleaned
-                            modified = True
-                            safe_print(f"  Character {char_id}, Text {text_id}: Cleaned ### marker")
-
-        # Save the file if modifications were made
-        if modified:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            return True
-
-        return False
+    def report(char_id, text_id, before, after):
+        safe_print(f"  Character {char_id}, Text {text_id}: Cleaned ### marker")
 
-    except Exception as e:
-        print(f"Error processing {file_path}: {e}")
-        return False
+    return bool(clean_chardict_file(file_path, [HashMarkerRule()], report))
 
 
 def safe_print(text):
@@ -63,6 +29,7 @@ def safe_print(text):
 
 def main():
     """Main function to process character_system_text_dict.json."""
+    configure_json()
     file_path = Path('character_system_text_dict.json')
 
     if not file_path.exists():
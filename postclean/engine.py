@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Apply postclean rules to story files and character_system_text_dict.json.
+
+Each file is loaded once, every rule runs over every slot in a single
+traversal, and the file is only written back if something changed. Story
+files are spread across a process pool.
+"""
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import toml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from honsetrans import jsonio
+from honsetrans.segments import iter_story_segments
+
+
+def configure_json(config_path='config.toml'):
+    """Use the JSON backend chosen in config.toml, if there is one."""
+    if Path(config_path).exists():
+        jsonio.configure(toml.load(config_path))
+
+
+def apply_rules(text, kind, rules, counts):
+    """Run text through every rule, counting the rules that changed it."""
+    for rule in rules:
+        fixed = rule.fix(text, kind)
+        if fixed != text:
+            counts[rule.name] = counts.get(rule.name, 0) + 1
+            text = fixed
+    return text
+
+
+def clean_story_file(file_path, rules):
+    """
+    Apply rules to every translated slot of one story file.
+
+    Returns {rule name: number of fixes}, empty if the file was left alone.
+    """
+    try:
+        data = jsonio.load(file_path)
+
+        counts = {}
+        for segment in iter_story_segments(data):
+            value = segment.value
+            fixed = apply_rules(value, segment.kind, rules, counts)
+            if fixed != value:
+                segment.set(fixed)
+
+        # Save the file if modifications were made
+        if counts:
+            jsonio.dump(data, file_path)
+        return counts
+
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return {}
+
+
+def _clean_story_file_job(args):
+    file_path, rules = args
+    return file_path, clean_story_file(file_path, rules)
+
+
+def clean_story_files(file_paths, rules, processes=None):
+    """Clean many story files in parallel, yielding (file_path, counts) as each one finishes."""
+    with ProcessPoolExecutor(max_workers=processes, initializer=jsonio.set_backend,
+                             initargs=(jsonio.get_backend(),)) as pool:
+        yield from pool.map(_clean_story_file_job, ((path, rules) for path in file_paths), chunksize=16)
+
+
+def clean_chardict_file(file_path, rules, on_fix=None):
+    """
+    Apply rules to every text in character_system_text_dict.json.
+
+    on_fix(char_id, text_id, before, after) is called for each changed text.
+    Returns {rule name: number of fixes}.
+    """
+    try:
+        data = jsonio.load(file_path)
+
+        counts = {}
+        # Iterate through character IDs
+        for char_id, text_dict in data.items():
+            if not isinstance(text_dict, dict):
+                continue
+            # Iterate through text IDs and their values
+            for text_id, text_value in text_dict.items():
+                fixed = apply_rules(text_value, 'chardict', rules, counts)
+                if fixed != text_value:
+                    text_dict[text_id] = fixed
+                    if on_fix is not None:
+                        on_fix(char_id, text_id, text_value, fixed)
+
+        # Save the file if modifications were made
+        if counts:
+            jsonio.dump(data, file_path)
+        return counts
+
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return {}
+
+
+def find_story_files():
+    """All JSON files under raw/story and raw/home."""
+    json_files = []
+    for folder in (Path('raw/story'), Path('raw/home')):
+        if folder.exists():
+            json_files.extend(folder.rglob('*.json'))
+    return json_files
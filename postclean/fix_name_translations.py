@@ -2,14 +2,18 @@
 """
 Fix name translations in story JSON files using the dictionary.
 """
-import json
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from honsetrans import jsonio
+from postclean.engine import clean_story_file, clean_story_files, configure_json, find_story_files
+from postclean.rules import NameFixRule
+
 
 def load_dictionary(dict_path='../dictionary.json'):
     """Load the dictionary of correct name translations."""
-    with open(dict_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return jsonio.load(dict_path)
 
 
 def create_fix_mappings():
@@ -52,34 +56,7 @@ def create_fix_mappings():
 
 def fix_json_file(file_path, fix_mappings):
     """Fix name translations in a single JSON file."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        modified = False
-
-        # Process text array if it exists
-        if 'text' in data and isinstance(data['text'], list):
-            for item in data['text']:
-                if isinstance(item, dict):
-                    # Fix enName
-                    if 'enName' in item:
-                        old_name = item['enName']
-                        if old_name in fix_mappings:
-                            item['enName'] = fix_mappings[old_name]
-                            modified = True
-
-        # Save the file if modifications were made
-        if modified:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            return True
-
-        return False
-
-    except Exception as e:
-        print(f"Error processing {file_path}: {e}")
-        return False
+    return bool(clean_story_file(file_path, [NameFixRule(fix_mappings)]))
 
 
 def safe_print(text):
@@ -92,6 +69,7 @@ def safe_print(text):
 
 def main():
     """Main function to fix name translations in all story files."""
+    configure_json()
     raw_story_dir = Path('raw/story')
     raw_home_dir = Path('raw/home')
 
@@ -109,11 +87,7 @@ def main():
     safe_print(f"Will fix {len(fix_mappings)} known mistranslations\n")
 
     # Find all JSON files recursively from both directories
-    json_files = []
-    if raw_story_dir.exists():
-        json_files.extend(list(raw_story_dir.rglob('*.json')))
-    if raw_home_dir.exists():
-        json_files.extend(list(raw_home_dir.rglob('*.json')))
+    json_files = find_story_files()
 
     total_files = len(json_files)
     modified_count = 0
@@ -121,8 +95,8 @@ def main():
     safe_print(f"Found {total_files} JSON files in raw/story and raw/home folders.")
     safe_print("Processing...\n")
 
-    for i, json_file in enumerate(json_files, 1):
-        if fix_json_file(json_file, fix_mappings):
+    for i, (json_file, counts) in enumerate(clean_story_files(json_files, [NameFixRule(fix_mappings)]), 1):
+        if counts:
             modified_count += 1
             safe_print(f"[{i}/{total_files}] Modified: {str(json_file)}")
         else:
@@ -2,9 +2,13 @@
 """
 Fix name translations in character_system_text_dict.json using the fix mappings.
 """
-import json
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from postclean.engine import clean_chardict_file, configure_json
+from postclean.rules import NameFixRule
+
 
 def create_fix_mappings():
     """
@@ -44,57 +48,16 @@ def create_fix_mappings():
     }
 
 
-def fix_text_value(text, fix_mappings):
-    """Fix name translations in a text value."""
-    if not isinstance(text, str):
-        return text, False
-
-    original = text
-    modified = False
-
-    # Apply all fix mappings
-    for old_name, new_name in fix_mappings.items():
-        if old_name in text:
-            text = text.replace(old_name, new_name)
-            modified = True
-
-    return text, modified
-
-
 def process_character_dict(file_path, fix_mappings):
     """Process character_system_text_dict.json to fix name translations."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        modified = False
-        fix_count = 0
-
-        # Iterate through character IDs
-        for char_id, text_dict in data.items():
-            if isinstance(text_dict, dict):
-                # Iterate through text IDs and their values
-                for text_id, text_value in list(text_dict.items()):
-                    fixed_text, was_modified = fix_text_value(text_value, fix_mappings)
-                    if was_modified:
-                        text_dict[text_id] = fixed_text
-                        modified = True
-                        fix_count += 1
-                        safe_print(f"  Character {char_id}, Text {text_id}: Fixed name translation")
-                        safe_print(f"    Before: {text_value}")
-                        safe_print(f"    After:  {fixed_text}")
-
-        # Save the file if modifications were made
-        if modified:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            return True, fix_count
-
-        return False, 0
-
-    except Exception as e:
-        print(f"Error processing {file_path}: {e}")
-        return False, 0
+    def report(char_id, text_id, before, after):
+        safe_print(f"  Character {char_id}, Text {text_id}: Fixed name translation")
+        safe_print(f"    Before: {before}")
+        safe_print(f"    After:  {after}")
+
+    counts = clean_chardict_file(file_path, [NameFixRule(fix_mappings)], report)
+    fix_count = counts.get(NameFixRule.name, 0)
+    return bool(fix_count), fix_count
 
 
 def safe_print(text):
@@ -107,6 +70,7 @@ def safe_print(text):
 
 def main():
     """Main function to fix name translations in character_system_text_dict.json."""
+    configure_json()
     file_path = Path('character_system_text_dict.json')
 
     if not file_path.exists():
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Cleanup rules shared by the postclean scripts.
+
+A rule takes one translated string and the kind of slot it came from
+("title", "name", "text" or "choice" in story files, "chardict" in
+character_system_text_dict.json) and returns the fixed string.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from honsetrans.replacer import Replacer
+
+
+def clean_hash_marker(text):
+    """Remove '###' and everything after it from a string."""
+    if not isinstance(text, str):
+        return text
+
+    if '###' in text:
+        # Split on ### and take only the part before it
+        cleaned = text.split('###')[0]
+        # Strip trailing whitespace
+        return cleaned.rstrip()
+    return text
+
+
+def fix_text_value(text, fix_mappings):
+    """
+    Fix name translations in a text value.
+
+    fix_mappings can be a plain dict or a Replacer compiled from one; compile
+    it once up front when fixing many values.
+    """
+    if not isinstance(text, str):
+        return text, False
+
+    if not isinstance(fix_mappings, Replacer):
+        fix_mappings = Replacer(fix_mappings)
+    text, count = fix_mappings.subn(text)
+    return text, count > 0
+
+
+class HashMarkerRule:
+    """Strip '###' markers and everything after them from every slot."""
+
+    name = 'hash_markers'
+
+    def fix(self, text, kind):
+        return clean_hash_marker(text)
+
+
+class NameFixRule:
+    """
+    Replace known mistranslated names: whole enName values in story files,
+    and any occurrence inside character system text.
+    """
+
+    name = 'name_fixes'
+
+    def __init__(self, fix_mappings, word_boundaries=False):
+        self.fix_mappings = fix_mappings
+        self.replacer = Replacer(fix_mappings, word_boundaries)
+
+    def fix(self, text, kind):
+        if kind == 'name':
+            if isinstance(text, str) and text in self.fix_mappings:
+                return self.fix_mappings[text]
+            return text
+        if kind == 'chardict':
+            return self.replacer.sub(text)
+        return text
@@ -1,83 +1,151 @@
-import json
-import requests
+import argparse
+import os
 import toml
 import time
 
-# Load dictionary
-with open("dictionary.json", "r", encoding="utf-8") as file:
-    dictionary = json.load(file)
-    dictionary_json_str = json.dumps(dictionary, ensure_ascii=False)
+from honsetrans import jsonio
+from honsetrans.chardict import CharDictStore, iter_char_texts
+from honsetrans.checkpoint import Checkpoint, atomic_write_json
+from honsetrans.dedup import run_deduplicated
+from honsetrans.dictindex import DictionaryIndex
+from honsetrans.engine import Job, run_jobs
+from honsetrans.metrics import file_scope
+from honsetrans.planner import Planner
+from honsetrans.replacer import Replacer
+from honsetrans.translator import Translator
+from postclean.fix_name_translations_chardict import create_fix_mappings
 
 # Load config
 with open("config.toml", "r") as f:
     config = toml.load(f)
 
-# Load existing translations to avoid duplicates
-try:
-    with open("character_system_text_dict.json", "r", encoding="utf-8") as file:
-        existing_translations = json.load(file)
-    print("Loaded existing translations from character_system_text_dict.json")
-except FileNotFoundError:
-    print("No existing translations found, starting fresh")
-    existing_translations = {}
+jsonio.configure(config)
+
+# Load dictionary
+dictionary = jsonio.load("dictionary.json")
+
+translator = Translator(config, dictionary)
+
+# Known name mistranslations are fixed as entries are written, whole words only
+NAME_FIXES = (Replacer(create_fix_mappings(), word_boundaries=True)
+              if config.get("validation", {}).get("fixes", True) else None)
+
+character_config = config.get("character_system", {})
+DICT_PATH = "character_system_text_dict.json"
+SIDECAR_PATH = character_config.get("sidecar", "character_system_text_dict.sqlite3")
+
+# Identical lines in different character blocks are translated once
+run_translations = run_deduplicated if config.get("dedup", {}).get("enabled", True) else run_jobs
+
+def log(line):
+    """Per-entry output, only shown with [metrics] verbose = true."""
+    if translator.metrics.verbose:
+        print(line)
+
+def clean_text(text):
+    text = text.replace('\n', ' ').replace('  ', ' ').replace("\n### Response:\n", "").strip()
+    if NAME_FIXES is not None:
+        text = NAME_FIXES.sub(text)
+    return text
+
+def load_existing_translations():
+    """Load the dict file, folding in anything a streaming run left in the sidecar first."""
+    if os.path.exists(SIDECAR_PATH):
+        compact_character_system_dict()
+    # Load existing translations to avoid duplicates
+    try:
+        existing_translations = jsonio.load(DICT_PATH)
+        print(f"Loaded existing translations from {DICT_PATH}")
+    except FileNotFoundError:
+        print("No existing translations found, starting fresh")
+        existing_translations = {}
+    return existing_translations
 
-def translate(rawText):
-    api_key = config["server"]["api_key"]
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-
-    post_request = {
-        "model": config["server"]["model"],
-        "temperature": config["server"]["temperature"],
-        "messages": [
-            {
-                "role": "system",
-                "content": f"{config['server']['system_prompt']} Refer to below for a dictionary in json format with the order japanese_text : english_text. (example\"ミホノブルボン\": \"Mihono Bourbon\", which means translate ミホノブルボン to Mihono Bourbon. \n {dictionary_json_str} \n translate the below text",
-            },
-            {
-                "role": "user", "content": rawText
-            }
-        ],
-    }
-
-    optional_params = {
-        "top_p": config["server"]["top_p"],
-        "top_k": config["server"]["top_k"],
-        "max_tokens": config["server"]["max_tokens"],
-        "repetition_penalty": config["server"]["repetition_penalty"]
-    }
-
-    for param, value in optional_params.items():
-        if value is not None:
-            post_request[param] = value
-
-    response = requests.post(
-        config["server"]["api_url"],
-        headers=headers,
-        json=post_request
-    )
-    json_traslated = response.json()
-    trans_text = json_traslated["choices"][0]["message"]["content"]
-    print(f"Translation: {trans_text}")
-    return trans_text
+def compact_character_system_dict():
+    store = CharDictStore(DICT_PATH, SIDECAR_PATH)
+    try:
+        merged = store.compact()
+    finally:
+        store.close()
+    if merged:
+        print(f"Compacted {merged} new translations from {SIDECAR_PATH} into {DICT_PATH}")
+    return merged
+
+def invalidate_dictionary_changes():
+    """
+    Drop the dict entries whose Japanese text uses a dictionary.json entry
+    that was added, removed or changed since the last run, so only those
+    are translated again.
+    """
+    invalidation_config = config.get("invalidation", {})
+    if not invalidation_config.get("enabled", True):
+        return
+    index = DictionaryIndex(invalidation_config.get("index", "dictionary_index.sqlite3"), dictionary)
+    try:
+        changed = index.changed_keys("character_system")
+        if changed:
+            print(f"{len(changed)} dictionary entries changed since the last run")
+            streaming = character_config.get("streaming", False) or os.path.exists(SIDECAR_PATH)
+            if not index.is_fresh("character_system_text.json"):
+                print("Indexing dictionary terms in character_system_text.json")
+                char_items = (iter_char_texts("character_system_text.json") if streaming
+                              else jsonio.load("character_system_text.json").items())
+                index.update_file("character_system_text.json", (
+                    (f"{char_id}/{text_id}", jp_text)
+                    for char_id, char_texts in char_items for text_id, jp_text in char_texts.items()
+                    if isinstance(jp_text, str)))
+
+            keys = index.affected(changed).get("character_system_text.json", set())
+            # A journal from an interrupted run mustn't put the old translations back
+            Checkpoint(DICT_PATH, None, config.get("checkpoint")).forget(keys.__contains__)
+            entries = [key.split("/", 1) for key in keys]
+            if streaming:
+                store = CharDictStore(DICT_PATH, SIDECAR_PATH)
+                try:
+                    cleared = store.remove(entries)
+                finally:
+                    store.close()
+            else:
+                cleared = 0
+                if os.path.exists(DICT_PATH):
+                    existing_translations = jsonio.load(DICT_PATH)
+                    for char_id, text_id in entries:
+                        if existing_translations.get(char_id, {}).pop(text_id, None) is not None:
+                            cleared += 1
+                    if cleared:
+                        atomic_write_json(DICT_PATH, existing_translations)
+            print(f"Cleared {cleared} translations in {DICT_PATH} that use them")
+        index.save_snapshot("character_system")
+    finally:
+        index.close()
+
+def restore_source_order(jobs):
+    """
+    Move each job's text_id to the end of its character block, in job
+    (source) order, so new entries land in the same order however the
+    replies came back.
+    """
+    for job in jobs:
+        if job.field in job.target:
+            job.target[job.field] = job.target.pop(job.field)
 
 def process_character_system_text():
     print("Loading character_system_text.json")
     file_start_time = time.time()
+    invalidate_dictionary_changes()
+    existing_translations = load_existing_translations()
 
-    with open("character_system_text.json", "r", encoding="utf-8") as file:
-        char_data = json.load(file)
+    char_data = jsonio.load("character_system_text.json")
 
     total_processed = 0
     total_skipped = 0
     total_translated = 0
 
     combined_translations = existing_translations.copy()
+    jobs = []
 
     for char_id, char_texts in char_data.items():
-        print(f"\n=== Processing Character ID: {char_id} ===")
+        log(f"\n=== Processing Character ID: {char_id} ===")
 
         # Ensure this character ID exists in combined translations
         if char_id not in combined_translations:
@@ -92,25 +160,26 @@ def process_character_system_text():
             total_processed += 1
 
             if text_id in existing_char:
-                print(f"  Text ID {text_id} (SKIP): Already translated in dict")
+                log(f"  Text ID {text_id} (SKIP): Already translated in dict")
                 total_skipped += 1
                 continue
 
             if not jp_text or not jp_text.strip():
-                print(f"  Text ID {text_id} (SKIP): Empty text")
+                log(f"  Text ID {text_id} (SKIP): Empty text")
                 total_skipped += 1
                 continue
 
-            print(f"  Text ID {text_id}: {jp_text}")
-            en_text = translate(jp_text)
-            en_text = en_text.replace('\n', ' ').replace('  ', ' ').replace("\n### Response:\n", "").strip()
-
-            combined_translations[char_id][text_id] = en_text
-            print(f"  Translated: {en_text}")
+            log(f"  Text ID {text_id}: {jp_text}")
+            jobs.append(Job(f"{char_id}/{text_id}", jp_text, combined_translations[char_id], text_id, clean_text))
             total_translated += 1
 
-    with open("character_system_text_dict.json", "w", encoding="utf-8") as file:
-        json.dump(combined_translations, file, indent=4, ensure_ascii=False)
+    checkpoint = Checkpoint(DICT_PATH, combined_translations, config.get("checkpoint"))
+    remaining = checkpoint.replay(jobs)
+    with file_scope("character_system_text.json"):
+        run_translations(remaining, translator, translator.max_concurrency, config.get("batch"), checkpoint.record)
+
+    restore_source_order(jobs)
+    checkpoint.save()
 
     file_end_time = time.time()
     file_duration = file_end_time - file_start_time
@@ -120,9 +189,134 @@ def process_character_system_text():
     print(f"Total entries processed: {total_processed}")
     print(f"Skipped (already in dict): {total_skipped}")
     print(f"Newly translated: {total_translated}")
-    print(f"Saved combined translations to character_system_text_dict.json")
+    print(f"Saved combined translations to {DICT_PATH}")
+    print(f"Total time: {file_duration:.2f} seconds.")
+    for line in translator.summary():
+        print(line)
+    report_path = translator.metrics.write_report()
+    if report_path:
+        print(f"Run report saved to {report_path}")
+    print(f"{'='*50}")
+
+def process_character_system_text_streaming():
+    """
+    Same as process_character_system_text, but neither JSON file is ever
+    loaded whole: characters are read one at a time, jobs are sent in chunks
+    and every finished translation is appended to the sidecar store.
+    """
+    print("Streaming character_system_text.json")
+    file_start_time = time.time()
+    invalidate_dictionary_changes()
+    store = CharDictStore(DICT_PATH, SIDECAR_PATH)
+    chunk_size = character_config.get("chunk_size", 500)
+
+    total_processed = 0
+    total_skipped = 0
+    total_translated = 0
+    # Place of each pending entry in the source file, so compaction can keep source order
+    positions = {}
+
+    def record(job):
+        char_id, text_id = job.key.split("/", 1)
+        store.add(char_id, text_id, job.target[job.field], positions.pop(job.key, None))
+
+    def flush(jobs):
+        with file_scope("character_system_text.json"):
+            run_translations(jobs, translator, translator.max_concurrency, config.get("batch"), record)
+        jobs.clear()
+
+    try:
+        jobs = []
+        for char_id, char_texts in iter_char_texts("character_system_text.json"):
+            log(f"\n=== Processing Character ID: {char_id} ===")
+            done = store.translated_ids(char_id)
+            slots = {}
+
+            for text_id, jp_text in char_texts.items():
+                total_processed += 1
+
+                if text_id in done:
+                    log(f"  Text ID {text_id} (SKIP): Already translated in dict")
+                    total_skipped += 1
+                    continue
+
+                if not jp_text or not jp_text.strip():
+                    log(f"  Text ID {text_id} (SKIP): Empty text")
+                    total_skipped += 1
+                    continue
+
+                log(f"  Text ID {text_id}: {jp_text}")
+                positions[f"{char_id}/{text_id}"] = total_processed
+                jobs.append(Job(f"{char_id}/{text_id}", jp_text, slots, text_id, clean_text))
+                total_translated += 1
+
+            if len(jobs) >= chunk_size:
+                flush(jobs)
+        flush(jobs)
+
+        if character_config.get("compact", True):
+            merged = store.compact()
+            print(f"Compacted {merged} new translations into {DICT_PATH}")
+        else:
+            print(f"{store.pending_count()} translations waiting in {SIDECAR_PATH}, "
+                  f"run py translate_character_system.py --compact to write {DICT_PATH}")
+    finally:
+        store.close()
+
+    file_duration = time.time() - file_start_time
+
+    print(f"\n{'='*50}")
+    print(f"Translation complete!")
+    print(f"Total entries processed: {total_processed}")
+    print(f"Skipped (already in dict): {total_skipped}")
+    print(f"Newly translated: {total_translated}")
     print(f"Total time: {file_duration:.2f} seconds.")
+    for line in translator.summary():
+        print(line)
+    report_path = translator.metrics.write_report()
+    if report_path:
+        print(f"Run report saved to {report_path}")
     print(f"{'='*50}")
 
+def plan_character_system_text():
+    """Count and cost the pending text_ids without sending anything or touching the dict file."""
+    print("Planning character_system_text.json (no requests are sent)")
+    planner = Planner(config, dictionary)
+    store = None
+    existing_translations = {}
+    if character_config.get("streaming", False) or os.path.exists(SIDECAR_PATH):
+        store = CharDictStore(DICT_PATH, SIDECAR_PATH)
+        char_items = iter_char_texts("character_system_text.json")
+    else:
+        if os.path.exists(DICT_PATH):
+            existing_translations = jsonio.load(DICT_PATH)
+        char_items = jsonio.load("character_system_text.json").items()
+
+    try:
+        for char_id, char_texts in char_items:
+            done = store.translated_ids(char_id) if store is not None else existing_translations.get(char_id, {})
+            for text_id, jp_text in char_texts.items():
+                if text_id not in done and jp_text and jp_text.strip():
+                    planner.add("text_id", jp_text)
+    finally:
+        if store is not None:
+            store.close()
+    for line in planner.lines():
+        print(line)
+
 if __name__ == "__main__":
-    process_character_system_text()
+    parser = argparse.ArgumentParser(description="Translate character_system_text.json into character_system_text_dict.json")
+    parser.add_argument("--compact", action="store_true",
+                        help=f"only merge translations waiting in the sidecar store into {DICT_PATH}")
+    parser.add_argument("--plan", action="store_true",
+                        help="only count pending entries and estimate tokens and time, without sending requests")
+    args = parser.parse_args()
+    if args.plan:
+        plan_character_system_text()
+    elif args.compact:
+        if not compact_character_system_dict():
+            print(f"Nothing to compact, {DICT_PATH} is up to date")
+    elif character_config.get("streaming", False):
+        process_character_system_text_streaming()
+    else:
+        process_character_system_text()